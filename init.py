@@ -2,7 +2,8 @@
 # init.py — richtet RPN-CALC (Node) + RPN-REPL (Python) ein,
 # erstellt Default-Dateien (mit Rückfrage) und führt Tests aus.
 
-import json, os, subprocess, sys, shutil
+import json, os, subprocess, sys, shutil, tempfile
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 HOME = Path.home()
@@ -18,19 +19,74 @@ RPN_JS         = PROJECT / "rpn.js"
 RPN_REPL_PY    = PROJECT / "rpn_repl.py"
 PKG_JSON       = PROJECT / "package.json"
 
+# fertige str-Pfade für Kommandozeilen
+RPN_JS_STR     = os.fspath(RPN_JS)
+FUNCS_FILE_STR = os.fspath(FUNCS_FILE)
+
+# Default-Inhalte (einmalig beim Import serialisiert)
+_SIMVARS_BYTES = (json.dumps({
+    "simvars": {
+        "A:PLANE HEADING DEGREES, Degrees": 270,
+        "A:GENERAL ENG THROTTLE LEVER POSITION:1, Percent": 50
+    }
+}, indent=2, ensure_ascii=False) + "\n").encode("utf-8")
+_FUNCS_BYTES = (json.dumps([
+    {"name": "add90", "params": 1, "rpn": "p1 90 + dnor"},
+    {"name": "wrap360", "params": 1, "rpn": "p1 360 % 360 + 360 %"},
+    {"name": "angle_diff", "params": 2, "rpn": "p1 p2 - 360 + 360 %"}
+], indent=2, ensure_ascii=False) + "\n").encode("utf-8")
+# State/Stack werden nur maschinell gelesen/geschrieben -> kompakt
+_STATE_BYTES = (json.dumps({"vars": [0]*10}, separators=(",", ":")) + "\n").encode("utf-8")
+_STACK_BYTES = (json.dumps({"results": []}, separators=(",", ":")) + "\n").encode("utf-8")
+
+# absolute Pfade aus ensure_node_npm (kein erneuter PATH-Lookup pro Aufruf)
+NODE_BIN = "node"
+NPM_BIN = "npm"
+# Smoke-Tests sind Einmal-Aufrufe: ohne JIT-Optimierer und ohne Warnungen starten
+NODE_ONESHOT_FLAGS = ["--jitless", "--no-warnings"]
+
 # --- CLI Optionen ---
 AUTO_YES = "--yes" in sys.argv or "-y" in sys.argv
+RUN_TESTS = "--no-tests" not in sys.argv
+
+
+_dir_names = {}   # Verzeichnis -> Dateinamen (ein scandir statt stat() pro Datei)
+
+
+def scan_dirs(*dirs):
+    for d in dirs:
+        try:
+            with os.scandir(d) as it:
+                _dir_names[d] = {e.name for e in it}
+        except OSError:
+            pass
+
+
+def exists(path: Path) -> bool:
+    """Existenz laut scan_dirs(); ohne Scan des Verzeichnisses normales stat()"""
+    names = _dir_names.get(path.parent)
+    return path.name in names if names is not None else path.exists()
 
 
-def run(cmd, **popen_kwargs):
-    """führt Kommando aus und liefert (rc, stdout, stderr)"""
+def run(cmd, quiet=False, **popen_kwargs):
+    """führt Kommando aus und liefert (rc, stdout, stderr); quiet: stdout verwerfen (nur stderr lesen)"""
     try:
+        if quiet:
+            proc = subprocess.run(cmd, text=True, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, **popen_kwargs)
+            return proc.returncode, "", proc.stderr
         proc = subprocess.run(cmd, text=True, capture_output=True, **popen_kwargs)
         return proc.returncode, proc.stdout, proc.stderr
     except FileNotFoundError as e:
         return 127, "", str(e)
 
 
+def fail(out, err, msg):
+    """Gibt stdout/stderr eines Kommandos plus Fehlermeldung in einem write aus und beendet"""
+    sys.stdout.write(f"{out}\n{err}\n[FEHLER] {msg}\n")
+    sys.stdout.flush()
+    sys.exit(1)
+
+
 def ask_overwrite(path: Path) -> bool:
     """Fragt, ob eine Datei überschrieben werden soll"""
     if AUTO_YES:
@@ -40,11 +96,28 @@ def ask_overwrite(path: Path) -> bool:
         if ans in ("j", "y", "yes"):
             return True
         if ans in ("n", "no", "", None):
-            print(f"[=] Datei beibehalten: {path}")
             return False
 
 
+def ask_overwrite_all(paths):
+    """Eine Sammel-Rückfrage für alle vorhandenen Dateien.
+    Liefert True (alle überschreiben), False (alle behalten) oder None (einzeln fragen)."""
+    if AUTO_YES or not paths:
+        return True
+    listing = "\n".join(f"   - {p}" for p in paths)
+    while True:
+        ans = input(f"[?] Folgende Dateien existieren bereits:\n{listing}\n"
+                    "    Überschreiben? [a=alle/s=keine/e=einzeln, Standard: keine] ").strip().lower()
+        if ans in ("a", "j", "y", "yes"):
+            return True
+        if ans in ("s", "n", "no", ""):
+            return False
+        if ans == "e":
+            return None
+
+
 def ensure_node_npm():
+    global NODE_BIN, NPM_BIN
     node = shutil.which("node")
     npm = shutil.which("npm")
     errs = []
@@ -57,59 +130,103 @@ def ensure_node_npm():
         sys.exit(1)
     print(f"[ok] Node: {node}")
     print(f"[ok] npm : {npm}")
+    NODE_BIN, NPM_BIN = node, npm
+    return node, npm
 
 
 def ensure_npm_deps():
-    if not PKG_JSON.exists():
+    if not exists(PKG_JSON):
         print("[i] package.json nicht gefunden – führe 'npm init -y' aus...")
-        rc, out, err = run(["npm", "init", "-y"])
+        rc, out, err = run([NPM_BIN, "init", "-y"])
         if rc != 0:
-            print(out); print(err)
-            print("[FEHLER] npm init -y fehlgeschlagen")
-            sys.exit(1)
+            fail(out, err, "npm init -y fehlgeschlagen")
         print("[ok] package.json angelegt")
 
     print("[i] Installiere Abhängigkeiten: infix-rpn-eval ...")
-    rc, out, err = run(["npm", "install", "infix-rpn-eval"])
+    rc, out, err = run([NPM_BIN, "install", "infix-rpn-eval"], quiet=True)
     if rc != 0:
-        print(out); print(err)
-        print("[FEHLER] npm install fehlgeschlagen")
-        sys.exit(1)
+        fail(out, err, "npm install fehlgeschlagen")
     print("[ok] npm dependencies installiert")
 
 
-def write_file(path: Path, content: str):
-    """Schreibt Datei mit Rückfrage"""
-    if path.exists():
-        if not ask_overwrite(path):
-            return
-    path.write_text(content, encoding="utf-8")
+def _keep_or_ask(path: Path, overwrite) -> bool:
+    if overwrite is None:
+        overwrite = ask_overwrite(path)
+    if not overwrite:
+        print(f"[=] Datei beibehalten: {path}")
+    return overwrite
+
+
+def write_file(path: Path, data: bytes, overwrite=None) -> bool:
+    """Schreibt Datei atomar über Temp-Datei (kein halb geschriebenes JSON).
+    overwrite: True/False = Entscheidung steht schon fest, None = bei Bedarf nachfragen"""
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())   # Daten auf Platte vor link/replace, sonst nach Absturz evtl. leere Datei
+    try:
+        try:
+            # link() legt nur an, wenn path noch nicht existiert (Existenz-Check + Anlegen in einem Schritt)
+            os.link(tmp, path)
+        except FileExistsError:
+            if not _keep_or_ask(path, overwrite):
+                return False
+            os.replace(tmp, path)
+        except OSError:
+            # Dateisystem ohne Hardlinks
+            if path.exists() and not _keep_or_ask(path, overwrite):
+                return False
+            os.replace(tmp, path)
+    finally:
+        try:
+            tmp.unlink()
+        except FileNotFoundError:
+            pass
     print(f"[ok] Datei geschrieben: {path}")
+    return True
+
+
+def _fsync_dir(path: Path):
+    """Einmaliges fsync des Verzeichnisses (nicht unter Windows)"""
+    if os.name == "nt":
+        return
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
 
+DEFAULT_FILES = [
+    (SIMVARS_FILE, _SIMVARS_BYTES),
+    (FUNCS_FILE, _FUNCS_BYTES),
+    (STATE_FILE, _STATE_BYTES),
+    (STACK_FILE, _STACK_BYTES),
+]
 
-def write_default_files():
-    write_file(SIMVARS_FILE, json.dumps({
-        "simvars": {
-            "A:PLANE HEADING DEGREES, Degrees": 270,
-            "A:GENERAL ENG THROTTLE LEVER POSITION:1, Percent": 50
-        }
-    }, indent=2, ensure_ascii=False) + "\n")
 
-    write_file(FUNCS_FILE, json.dumps([
-        {"name": "add90", "params": 1, "rpn": "p1 90 + dnor"},
-        {"name": "wrap360", "params": 1, "rpn": "p1 360 % 360 + 360 %"},
-        {"name": "angle_diff", "params": 2, "rpn": "p1 p2 - 360 + 360 %"}
-    ], indent=2, ensure_ascii=False) + "\n")
+def ask_default_files():
+    """Alle Rückfragen vorab: Pfad -> überschreiben ja/nein (nur für vorhandene Dateien)"""
+    present = [path for path, _ in DEFAULT_FILES if exists(path)]
+    overwrite = ask_overwrite_all(present)
+    if overwrite is None:
+        return {path: ask_overwrite(path) for path in present}
+    return dict.fromkeys(present, overwrite)
 
-    write_file(STATE_FILE, json.dumps({"vars": [0]*10}, indent=2) + "\n")
-    write_file(STACK_FILE, json.dumps({"results": []}, indent=2) + "\n")
+
+def write_default_files(decisions):
+    # inzwischen entstandene Dateien (nicht in decisions) werden beibehalten statt nachzufragen
+    written = [write_file(path, data, decisions.get(path, False)) for path, data in DEFAULT_FILES]
+    if any(written):
+        _fsync_dir(HOME)
 
 
 def check_sources_present():
     missing = []
-    if not RPN_JS.exists():
-        missing.append(str(RPN_JS))
-    if not RPN_REPL_PY.exists():
+    if not exists(RPN_JS):
+        missing.append(RPN_JS_STR)
+    if not exists(RPN_REPL_PY):
         print(f"[!] Hinweis: {RPN_REPL_PY} nicht gefunden – REPL kann später ergänzt werden.")
     if missing:
         print("[FEHLER] Benötigte Datei(s) fehlen:")
@@ -120,27 +237,42 @@ def check_sources_present():
     print("[ok] rpn.js gefunden")
 
 
+def _run_batch(batch, tmpdir, idx):
+    """Führt eine Test-Gruppe in einem Node-Prozess aus (eigene State/Stack-Dateien je Worker)"""
+    exprs = "\n".join(expr for expr, _ in batch) + "\n"
+    iso = ["--state", str(tmpdir / f"state{idx}.json"), "--stack", str(tmpdir / f"stack{idx}.json")]
+    rc, out, err = run([NODE_BIN, *NODE_ONESHOT_FLAGS, RPN_JS_STR, "--batch"] + iso, input=exprs)
+    lines = (out or "").splitlines()
+    lines += [""] * (len(batch) - len(lines))
+    return rc, lines, err
+
+
 def smoke_tests():
     print("\n[¶] Starte Smoke-Tests mit rpn.js ...\n")
-    tests = [
-        ('"5 3 +"', "8"),
-        ('"330 90 + dnor"', "60"),
-        ('"1 2 3 +"', "1 5"),
-        ('"r,2"', "5"),
+    # Gruppen laufen parallel; innerhalb einer Gruppe der Reihe nach ("r,2" braucht das Ergebnis davor)
+    groups = [
+        [("5 3 +", "8"), ("330 90 + dnor", "60")],
+        [("1 2 3 +", "1 5"), ("r,2", "5")],
     ]
-    for expr, expected in tests:
-        cmd = ["node", str(RPN_JS), expr]
-        rc, out, err = run(cmd)
-        out = (out or "").strip()
-        ok = (expected in out) or (out == expected)
-        status = "ok" if (rc == 0 and ok) else "FAIL"
-        print(f"  - {status}: node rpn.js {expr}  -> '{out}'")
-        if rc != 0:
-            print("    stderr:", err.strip())
-
-    print("\n[¶] Test: Custom-Funktion (add90) ...")
-    rc, out, err = run(["node", str(RPN_JS), "330 add90", "--func", str(FUNCS_FILE)])
-    print(f"  - {'ok' if (rc==0 and out.strip()=='60') else 'FAIL'}: 330 add90 -> '{out.strip()}'")
+    with tempfile.TemporaryDirectory() as tmp, \
+            ThreadPoolExecutor(max_workers=min(len(groups) + 1, os.cpu_count() or 1)) as pool:
+        tmpdir = Path(tmp)
+        jobs = [pool.submit(_run_batch, batch, tmpdir, i) for i, batch in enumerate(groups)]
+        func_job = pool.submit(run, [NODE_BIN, *NODE_ONESHOT_FLAGS, RPN_JS_STR, "330 add90", "--func", FUNCS_FILE_STR,
+                                     "--state", str(tmpdir / "state_f.json"), "--stack", str(tmpdir / "stack_f.json")])
+        for batch, job in zip(groups, jobs):
+            rc, lines, err = job.result()
+            for (expr, expected), got in zip(batch, lines):
+                got = got.strip()
+                ok = got == expected
+                status = "ok" if ok else "FAIL"
+                print(f"  - {status}: node rpn.js \"{expr}\"  -> '{got}'")
+            if rc != 0:
+                print("    stderr:", err.strip())
+
+        print("\n[¶] Test: Custom-Funktion (add90) ...")
+        rc, out, err = func_job.result()
+        print(f"  - {'ok' if (rc==0 and out.strip()=='60') else 'FAIL'}: 330 add90 -> '{out.strip()}'")
 
 
 def final_message():
@@ -156,11 +288,18 @@ def final_message():
 
 
 def main():
+    scan_dirs(PROJECT, HOME)
     ensure_node_npm()
     check_sources_present()
-    ensure_npm_deps()
-    write_default_files()
-    smoke_tests()
+    # Rückfragen vor dem Start von npm: dessen Ausgabe/Abbruch soll nicht in einen input()-Prompt laufen
+    decisions = ask_default_files()
+    # npm install (Netzwerk) läuft parallel zum Schreiben der Dateien
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        npm_job = pool.submit(ensure_npm_deps)
+        write_default_files(decisions)
+        npm_job.result()
+    if RUN_TESTS:
+        smoke_tests()
     final_message()
 
 
@@ -27,6 +27,7 @@ const ANSI = {
   markOn: '\x1b[43m\x1b[30m', // bg yellow, fg black
   markOff: '\x1b[0m',
 };
+const ANSI_DEFAULTS = { ...ANSI };
 function applyNoColor() {
   ANSI.reset = '';
   ANSI.red = '';
@@ -42,17 +43,22 @@ function resolveArgPath(argv, flag, env, defName) {
   if (process.env[env]) return path.resolve(process.env[env]);
   return path.join(os.homedir(), defName);
 }
+const ensuredDirs = new Set();   // parent dirs already created/checked (--server writes many times)
 function atomicWrite(filePath, data) {
   const dir = path.dirname(filePath);
-  if (!fs.existsSync(dir)) fs.mkdirSync(dir, { recursive: true });
+  if (!ensuredDirs.has(dir)) {
+    fs.mkdirSync(dir, { recursive: true });
+    ensuredDirs.add(dir);
+  }
   const tmp = path.join(dir, `.tmp-${Date.now()}-${Math.random().toString(16).slice(2)}.json`);
   fs.writeFileSync(tmp, data, 'utf8');
   fs.renameSync(tmp, filePath);
 }
 function loadJSON(p, def) { try { return JSON.parse(fs.readFileSync(p, 'utf8')); } catch { return def; } }
-function saveJSON(p, obj) { try { atomicWrite(p, JSON.stringify(obj, null, 2)); } catch (e) { console.error('Warn:', e.message); } }
+// indent 0 = compact, for machine-only files (state, result stack)
+function saveJSON(p, obj, indent = 2) { try { atomicWrite(p, JSON.stringify(obj, null, indent)); } catch (e) { console.error('Warn:', e.message); } }
 function loadVars(p) { const o = loadJSON(p, { vars: Array(10).fill(0) }); return Array.isArray(o.vars) ? o.vars.slice(0,10).map(Number) : Array(10).fill(0); }
-function saveVars(p, vars) { saveJSON(p, { vars }); }
+function saveVars(p, vars) { saveJSON(p, { vars }, 0); }
 
 // simvars persisted per prefix: { simvars: { "A": { "KEY,Unit": v }, "L": { "ABC": v }, ... } }
 // also accept legacy: { simvars: { "TEST": 5 } }  -> A:TEST
@@ -79,22 +85,41 @@ function saveSimvars(p, simvars) { saveJSON(p, { simvars }); }
 
 function loadFuncs(p) { const a = loadJSON(p, []); return Array.isArray(a) ? a.filter(f => f && typeof f.name==='string' && Number.isFinite(f.params) && typeof f.rpn==='string') : []; }
 function loadResults(p) { const o = loadJSON(p, { results: [] }); return Array.isArray(o.results) ? o.results.filter(Array.isArray) : []; }
-function saveResults(p, results) { saveJSON(p, { results: results.slice(0,8) }); }
+function saveResults(p, results) { saveJSON(p, { results: results.slice(0,8) }, 0); }
 
 /* ---------- tokenizer & utils ---------- */
-function tokenize(src) {
+// one sticky regex per token: (...) up to two nesting levels, block tokens, stray braces, words;
+// a bare '(' (deeper nesting or unbalanced) falls back to the depth scan
+const TOKEN_RE = /\s*(?:(\((?:[^()]|\([^()]*\))*\))|(if\{|else\{|[{})])|([^\s(){}]+)|\()/y;
+function scanTokens(src) {
   const tokens = [];
-  let i = 0;
-  while (i < src.length) {
-    const ch = src[i];
-    if (/\s/.test(ch)) { i++; continue; }
-    if (ch === '(') { let d=1, j=i+1; while (j<src.length && d>0){ if (src[j]==='(') d++; else if (src[j]===')') d--; j++; } tokens.push(src.slice(i,j)); i=j; continue; }
-    if (src.startsWith('if{', i)) { tokens.push('if{'); i+=3; continue; }
-    if (src.startsWith('else{', i)) { tokens.push('else{'); i+=5; continue; }
-    if (ch === '}') { tokens.push('}'); i++; continue; }
-    let j = i; while (j < src.length && !/\s/.test(src[j]) && !'(){}'.includes(src[j])) j++; tokens.push(src.slice(i, j)); i = j;
+  TOKEN_RE.lastIndex = 0;
+  let m;
+  while ((m = TOKEN_RE.exec(src)) !== null) {
+    const tok = m[1] ?? m[2] ?? m[3];
+    if (tok !== undefined) { tokens.push(tok); continue; }
+    const i = TOKEN_RE.lastIndex - 1;
+    let d = 1, j = i + 1;
+    while (j < src.length && d > 0) { if (src[j] === '(') d++; else if (src[j] === ')') d--; j++; }
+    tokens.push(src.slice(i, j));
+    TOKEN_RE.lastIndex = j;
+  }
+  return tokens;
+}
+// --server re-tokenizes the same inputs and function bodies over and over (re-entered lines,
+// every call of a user function); token lists are never mutated, so cache them frozen (LRU)
+const TOKEN_CACHE = new Map();
+const TOKEN_CACHE_MAX = 512;
+function tokenize(src) {
+  let toks = TOKEN_CACHE.get(src);
+  if (toks !== undefined) {
+    TOKEN_CACHE.delete(src);
+  } else {
+    toks = Object.freeze(scanTokens(src));
+    if (TOKEN_CACHE.size >= TOKEN_CACHE_MAX) TOKEN_CACHE.delete(TOKEN_CACHE.keys().next().value);
   }
-  return tokens.filter(Boolean);
+  TOKEN_CACHE.set(src, toks);
+  return toks;
 }
 function isNumberToken(t) { return /^[-+]?\d+(?:[.,]\d+)?$/.test(t); }
 function parseNumber(t) { return parseFloat(t.replace(',', '.')); }
@@ -140,7 +165,8 @@ function precompileTokens(tokens, functions) {
 
 /* ---------- evaluator (operator-like functions by default) ---------- */
 function evaluateRPN(src, options = {}) {
-  const tokens = tokenize(src || '');
+  // src is an expression string or an already tokenized list (saves a join + re-scan)
+  const tokens = Array.isArray(src) ? src : tokenize(src || '');
   const stack = [];
   const regs = Array(10).fill(0);
   const vars = options.vars || Array(10).fill(0);
@@ -247,8 +273,7 @@ function evaluateRPN(src, options = {}) {
       const ps = Array(func.params);
       for (let k = func.params-1; k >= 0; k--) ps[k] = stack.pop();
       const bodyToks = tokenize(func.rpn).map(tok => /^p(\d+)$/.test(tok) ? String(ps[parseInt(tok.slice(1),10)-1] ?? 0) : tok);
-      const subExpr = bodyToks.join(' ');
-      const sub = evaluateRPN(subExpr, { vars, simvars, functions, results });
+      const sub = evaluateRPN(bodyToks, { vars, simvars, functions, results });
       sub.stack.forEach(v => stack.push(v));
       return idx+1;
     }
@@ -310,6 +335,12 @@ function evaluateRPN(src, options = {}) {
 }
 
 /* ---------- step-by-step (inline highlight, incl. conditionals, functions, INFIX mode) ---------- */
+// built once per process, not per stepVerbose call; operator -> arity in one lookup
+const UN_OPS = new Set(['not','!','round','floor','ceil','abs','sqrt2','sin','cos','tan','log','exp','dnor','pow2']);
+const BIN_OPS = new Set(['+','-','*','/','%','^','>','<','>=','<=','==','=','!=','<>','and','&&','or','||','min','max','pow','sqrt']);
+const OP_ARITY = new Map([
+  ...[...UN_OPS].map(op => [op, 1]), ...[...BIN_OPS].map(op => [op, 2]), ['clamp', 3], ['if{', 1]
+]);
 function stepVerbose(tokensInput, context = {}){
   let toks = tokensInput.slice();
   const vars = context.vars || Array(10).fill(0);
@@ -352,13 +383,9 @@ function stepVerbose(tokensInput, context = {}){
     }
     throw new Error("Token not a value: "+t);
   }
-  const UN_OPS = new Set(['not','!','round','floor','ceil','abs','sqrt2','sin','cos','tan','log','exp','dnor','pow2']);
-  const BIN_OPS = new Set(['+','-','*','/','%','^','>','<','>=','<=','==','=','!=','<>','and','&&','or','||','min','max','pow','sqrt']);
   function arity(op){
-    if (UN_OPS.has(op)) return 1;
-    if (BIN_OPS.has(op)) return 2;
-    if (op === 'clamp') return 3;
-    if (op === 'if{') return 1;
+    const k = OP_ARITY.get(op);
+    if (k !== undefined) return k;
     const f = fnMap.get(op);
     if (f) return f.params;
     return 0;
@@ -497,7 +524,7 @@ function stepVerbose(tokensInput, context = {}){
       const ifBody = toks.slice(opIndex + 1, endIf);
       const elseBody = hasElse ? toks.slice(elseStart + 1, endElse) : [];
       const body = takeIf ? ifBody : elseBody;
-      const sub = evaluateRPN(body.join(' '), { vars: vars.slice(), simvars: JSON.parse(JSON.stringify(simvars)), functions: Array.from(fnMap.values()), results: [] });
+      const sub = evaluateRPN(body, { vars: vars.slice(), simvars: JSON.parse(JSON.stringify(simvars)), functions: Array.from(fnMap.values()), results: [] });
       const outVals = sub.stack.map(v => String(Number.isFinite(v) && Math.abs(v - Math.round(v))<1e-12 ? Math.round(v) : v));
       const which = takeIf ? 'IF' : (hasElse ? 'ELSE' : 'NONE');
 
@@ -527,8 +554,7 @@ function stepVerbose(tokensInput, context = {}){
       const f = fnMap.get(chosenOp);
       if (f){
         const subToks = tokenize(f.rpn).map(tok => /^p(\d+)$/.test(tok) ? String(numsForApply[parseInt(tok.slice(1),10)-1] ?? 0) : tok);
-        const subExpr = subToks.join(' ');
-        const sub = evaluateRPN(subExpr, { vars: vars.slice(), simvars: JSON.parse(JSON.stringify(simvars)), functions: Array.from(fnMap.values()), results: [] });
+        const sub = evaluateRPN(subToks, { vars: vars.slice(), simvars: JSON.parse(JSON.stringify(simvars)), functions: Array.from(fnMap.values()), results: [] });
         res = sub.stack.length ? sub.stack[sub.stack.length-1] : 0;
         const resStr = String(Number.isFinite(res) && Math.abs(res - Math.round(res))<1e-12 ? Math.round(res) : res);
         console.log(`${ANSI.yellow}${argsForLog.map(a=>a.text).join(' ')} ${chosenOp} = ${resStr}${ANSI.reset}`);
@@ -548,11 +574,12 @@ function stepVerbose(tokensInput, context = {}){
         const resVal = apply(chosenOp, numsForApply);
         const resStr = String(Number.isFinite(resVal) && Math.abs(resVal - Math.round(resVal))<1e-12 ? Math.round(resVal) : resVal);
 
-        if (infixMode && BIN_OPS.has(chosenOp) && numsForApply.length === 2) {
+        const opArity = infixMode ? OP_ARITY.get(chosenOp) : undefined;
+        if (opArity === 2 && numsForApply.length === 2) {
           const left = argsForLog[0].text;
           const right = argsForLog[1].text;
           console.log(`${ANSI.yellow}${left} ${chosenOp} ${right} = ${resStr}${ANSI.reset}`);
-        } else if (infixMode && UN_OPS.has(chosenOp) && numsForApply.length === 1) {
+        } else if (opArity === 1 && numsForApply.length === 1) {
           const a = argsForLog[0].text;
           console.log(`${ANSI.yellow}${chosenOp} ${a} = ${resStr}${ANSI.reset}`);
         } else {
@@ -581,38 +608,72 @@ function stepVerbose(tokensInput, context = {}){
 
 /* ---------- prompts for pN ---------- */
 function question(rl, q){ return new Promise(resolve => rl.question(q, answer => resolve(answer))); }
+function parseParamInput(ans){ const val = Number(String(ans).trim().replace(',', '.')); return Number.isFinite(val) ? val : 0; }
+function missingParams(expr, initialParams = {}){
+  const used = new Set(tokenize(expr).filter(t => /^p\d+$/.test(t)));
+  return [...used].filter(k => !(k in initialParams)).sort((a,b)=>parseInt(a.slice(1)) - parseInt(b.slice(1)));
+}
 async function promptParamsIfNeeded(expr, initialParams = {}, { noPrompt = false } = {}){
-  const toks = tokenize(expr);
-  const used = new Set(toks.filter(t => /^p\d+$/.test(t)));
-  const missing = [...used].filter(k => !(k in initialParams)).sort((a,b)=>parseInt(a.slice(1)) - parseInt(b.slice(1)));
+  const missing = missingParams(expr, initialParams);
   if (missing.length === 0) return initialParams;
   const rl = readline.createInterface({ input: process.stdin, output: process.stdout });
   const params = { ...initialParams };
   for (const key of missing) {
     const label = noPrompt ? '' : `Wert für ${key}: `;
     const ans = await question(rl, label);
-    const raw = String(ans).trim().replace(',', '.'); const val = Number(raw);
-    params[key] = Number.isFinite(val) ? val : 0;
+    params[key] = parseParamInput(ans);
   }
   rl.close();
   return params;
 }
 
-/* ---------- CLI ---------- */
-(function cli(){
-  if (require.main !== module) return;
+/* ---------- evaluate one expression, persist state, print result ---------- */
+function runExpression(expr, params, opts) {
+  const vars = loadVars(opts.statePath);
+  const functions = loadFuncs(opts.funcPath);
+  const fileSimvars = loadSimvars(opts.simPath);   // normalized {A:{}, L:{}, ...}
+  const runtimeSimvars = Object.assign({}, fileSimvars, opts.inlineCtx.simvars || {});
+  const resultsHistory = loadResults(opts.stackPath);
 
-  const argv = process.argv.slice(2);
+  const evalToks = opts.doPre ? precompileTokens(tokenize(expr), functions) : tokenize(expr);
 
-  const doHelp = argv.includes('--help') || argv.includes('-?');
-  const doStep = argv.includes('--step') || argv.includes('-s');
-  const doPre  = argv.includes('--precompile') || argv.includes('-p');
-  const noPrompt = argv.includes('--noprompt');
+  const { stack, regs, vars: outVars, simvars: outSimvars, originalTokens, simvarsDirty, functions: outFunctions } =
+    evaluateRPN(evalToks, { vars, params, simvars: runtimeSimvars, functions, results: resultsHistory });
 
-  const noColor = argv.includes('--nocolor') || argv.includes('-c') || argv.includes('-n');
-  const marker = argv.includes('--mark') || argv.includes('-m');
-  const endStep = argv.includes('--endstep');
-  const infixMode = argv.includes('--infix') || argv.includes('-i');
+  // Persist
+  saveVars(opts.statePath, outVars);
+  if (simvarsDirty) saveSimvars(opts.simPath, outSimvars);
+
+  // History (unless pure r recall)
+  if (!isPureRTokenExpression(expr)) {
+    const newHistory = [ [...stack], ...resultsHistory ].slice(0,8);
+    saveResults(opts.stackPath, newHistory);
+  }
+
+  if (opts.doStep) {
+    stepVerbose(originalTokens, {
+      vars: outVars, regs, simvars: outSimvars, functions: outFunctions,
+      noColor: opts.noColor, marker: opts.marker, endStep: opts.endStep, infixMode: opts.infixMode
+    });
+  } else {
+    console.log(stack.join(' '));
+  }
+}
+
+/* ---------- CLI ---------- */
+// serverParams: set by --server; missing pN are reported back instead of prompted
+// serverCtx: context object sent with a --server request (instead of a --ctx JSON string in argv)
+async function runCli(argv, { serverParams = null, serverCtx = null } = {}) {
+  const flags = new Set(argv);   // one hash probe per flag check instead of an argv scan each
+  const doHelp = flags.has('--help') || flags.has('-?');
+  const doStep = flags.has('--step') || flags.has('-s');
+  const doPre  = flags.has('--precompile') || flags.has('-p');
+  const noPrompt = flags.has('--noprompt');
+
+  const noColor = flags.has('--nocolor') || flags.has('-c') || flags.has('-n');
+  const marker = flags.has('--mark') || flags.has('-m');
+  const endStep = flags.has('--endstep');
+  const infixMode = flags.has('--infix') || flags.has('-i');
 
   const statePath = resolveArgPath(argv, 'state', 'RPN_STATE', '.rpn_state.json');
   const simPath   = resolveArgPath(argv, 'sim',   'RPN_SIMVARS', '.simvars.json');
@@ -620,31 +681,38 @@ async function promptParamsIfNeeded(expr, initialParams = {}, { noPrompt = false
   const stackPath = resolveArgPath(argv, 'stack', 'RPN_STACK', '.rpnstack.json');
 
   // ---------- Reset/Print BEFORE help/expr checks ----------
-  if (argv.includes('--reset')) {
+  if (flags.has('--reset')) {
     saveVars(statePath, Array(10).fill(0));
     console.log('Variablen s0..s9 zurückgesetzt.');
     console.log('State-Datei:', statePath);
-    return;
+    return { code: 0 };
   }
-  if (argv.includes('--print')) {
+  if (flags.has('--print')) {
     const vars = loadVars(statePath);
     console.log('Persistente Variablen (s0..s9):', vars);
     console.log('State-Datei:', statePath);
-    return;
+    return { code: 0 };
   }
 
   const ctxIdx = argv.indexOf('--ctx');
   let inlineCtx = {};
-  if (ctxIdx !== -1 && argv[ctxIdx + 1]) {
-    try { inlineCtx = JSON.parse(argv[ctxIdx + 1]); }
-    catch (e) { console.error('Error: --ctx ist kein gültiges JSON:', e.message); process.exit(1); }
+  if (serverCtx && typeof serverCtx === 'object') inlineCtx = serverCtx;
+  else if (ctxIdx !== -1 && argv[ctxIdx + 1]) {
+    // a value not starting with '{' is a file path: big contexts need not be copied through argv
+    let raw = argv[ctxIdx + 1];
+    if (!raw.trimStart().startsWith('{')) {
+      try { raw = fs.readFileSync(raw, 'utf8'); }
+      catch (e) { console.error('Error: --ctx Datei nicht lesbar:', e.message); return { code: 1 }; }
+    }
+    try { inlineCtx = JSON.parse(raw); }
+    catch (e) { console.error('Error: --ctx ist kein gültiges JSON:', e.message); return { code: 1 }; }
   }
 
   // expression detection AFTER admin flags
   const hasExpr = argv.length && !argv[0].startsWith('--') && !argv[0].startsWith('-');
   const expr = hasExpr ? argv[0] : '';
 
-  if (doHelp || !hasExpr) {
+  if (doHelp || (!hasExpr && !flags.has('--batch'))) {
     console.log(`Usage:
   node rpn.js "<expr>" [options]
 
@@ -660,7 +728,9 @@ Options:
   --sim FILE         SimVars file (generic prefixes, e.g., A:, L:)
   --func FILE        Functions file (array of {name,params,rpn})
   --stack FILE       Result history file (r1..r8)
-  --ctx JSON         Inline context (e.g., simvars, params)
+  --ctx JSON|FILE    Inline context (e.g., simvars, params) or path to a JSON file
+  --batch            Read one expression per line from stdin, print one result line each
+  --server           Keep running: one JSON request {argv, params[, ctx]} per stdin line (used by rpn_repl.py)
   --print            Print persistent vars (works without <expr>)
   --reset            Reset persistent vars (works without <expr>)
   --help, -?         This help
@@ -672,57 +742,69 @@ Examples:
   node rpn.js "-5 10 +"
   node rpn.js "27 3 sqrt"
 `);
-    if (!hasExpr) return;
+    if (!hasExpr) return { code: 0 };
   }
 
-  const vars = loadVars(statePath);
-  const functions = loadFuncs(funcPath);
-  const fileSimvars = loadSimvars(simPath);   // normalized {A:{}, L:{}, ...}
-  const runtimeSimvars = Object.assign({}, fileSimvars, inlineCtx.simvars || {});
-  const resultsHistory = loadResults(stackPath);
-
-  (async () => {
-    const providedParams = inlineCtx.params || {};
-    const finalParams = await promptParamsIfNeeded(expr, providedParams, { noPrompt });
+  const opts = { statePath, simPath, funcPath, stackPath, inlineCtx, doPre, noColor, marker, endStep, infixMode,
+                 doStep: endStep || doStep };
 
-    try {
-      let evalExpr = expr;
-      if (doPre) {
-        const pre = precompileTokens(tokenize(expr), functions);
-        evalExpr = pre.join(' ');
-      }
-
-      const { stack, regs, vars: outVars, simvars: outSimvars, originalTokens, simvarsDirty, functions: outFunctions } =
-        evaluateRPN(evalExpr, { vars, params: finalParams, simvars: runtimeSimvars, functions, results: resultsHistory });
-
-      // Persist
-      saveVars(statePath, outVars);
-      if (simvarsDirty) saveSimvars(simPath, outSimvars);
+  // ---------- Batch: one expression per stdin line, one result line each ----------
+  if (flags.has('--batch')) {
+    let code = 0;
+    const lines = fs.readFileSync(0, 'utf8').split(/\r?\n/).filter(l => l.trim());
+    for (const line of lines) {
+      try { runExpression(line.trim(), inlineCtx.params || {}, opts); }
+      catch (e) { console.log('Error: ' + e.message); code = 1; }
+    }
+    return { code };
+  }
 
-      // History (unless pure r recall)
-      if (!isPureRTokenExpression(expr)) {
-        const newHistory = [ [...stack], ...resultsHistory ].slice(0,8);
-        saveResults(stackPath, newHistory);
-      }
+  const providedParams = inlineCtx.params || {};
+  let finalParams;
+  if (serverParams) {
+    const given = { ...providedParams };
+    for (const [k, v] of Object.entries(serverParams)) given[k] = parseParamInput(v);
+    const need = missingParams(expr, given);
+    if (need.length) return { code: 0, need };
+    finalParams = given;
+  } else {
+    finalParams = await promptParamsIfNeeded(expr, providedParams, { noPrompt });
+  }
 
-      const doStepEffective = (endStep || (argv.includes('--step') || argv.includes('-s')));
-      if (doStepEffective) {
-        stepVerbose(originalTokens, {
-          vars: outVars, regs, simvars: outSimvars, functions: outFunctions,
-          noColor: (argv.includes('--nocolor') || argv.includes('-c') || argv.includes('-n')),
-          marker: (argv.includes('--mark') || argv.includes('-m')),
-          endStep: argv.includes('--endstep'),
-          infixMode: (argv.includes('--infix') || argv.includes('-i'))
-        });
-      } else {
-        console.log(stack.join(' '));
-      }
+  try {
+    runExpression(expr, finalParams, opts);
+  } catch (e) {
+    console.error('Error:', e.message);
+    return { code: 1 };
+  }
+  return { code: 0 };
+}
 
+/* ---------- server: one JSON request per stdin line ({argv, params}) ---------- */
+// Output of a request is written as usual, terminated by SERVER_EOT + JSON status line.
+const SERVER_EOT = '\x04';
+async function serve() {
+  const rl = readline.createInterface({ input: process.stdin, terminal: false });
+  for await (const line of rl) {
+    if (!line.trim()) continue;
+    let status;
+    try {
+      const req = JSON.parse(line);
+      Object.assign(ANSI, ANSI_DEFAULTS);
+      status = await runCli(req.argv || [], { serverParams: req.params || {}, serverCtx: req.ctx || null });
     } catch (e) {
       console.error('Error:', e.message);
-      process.exit(1);
+      status = { code: 1 };
     }
-  })();
+    process.stdout.write(SERVER_EOT + JSON.stringify(status) + '\n');
+  }
+}
+
+(function cli(){
+  if (require.main !== module) return;
+  const argv = process.argv.slice(2);
+  if (argv.includes('--server')) { serve(); return; }
+  runCli(argv).then(({ code }) => { if (code) process.exitCode = code; });
 })();
 
 module.exports = { evaluateRPN, precompileTokens };
@@ -7,9 +7,14 @@
 # readline history + tab completion, parameter prompting (labels in CLI & REPL by default),
 # :noprompt toggle in REPL to hide labels.
 
-import os, sys, json, re, math, subprocess, atexit
+import os, sys, json, re, math, copy, array, bisect, operator, shlex, shutil, signal, subprocess, atexit, functools
 from pathlib import Path
 
+try:
+  import orjson   # optional: much faster parsing of large SimVars/function files
+except ImportError:
+  orjson = None
+
 # ----------- Paths / defaults -----------
 HOME = Path.home()
 STATE_PATH = Path(os.environ.get("RPN_STATE", str(HOME / ".rpn_state.json")))
@@ -18,6 +23,9 @@ FUNC_PATH  = Path(os.environ.get("RPN_FUNCS", str(HOME / ".rpnfunc.json")))
 STACK_PATH = Path(os.environ.get("RPN_STACK", str(HOME / ".rpnstack.json")))
 HIST_PATH  = Path(os.environ.get("RPN_REPL_HISTORY", str(HOME / ".rpn_repl_history")))
 HIST_MAX   = 100
+EDITOR     = os.environ.get("EDITOR", "vim")
+# only split when $EDITOR is not itself a program (e.g. "code -w"); Windows paths keep their spaces/quotes
+EDITOR_CMD = [EDITOR] if os.name == "nt" or shutil.which(EDITOR) else (shlex.split(EDITOR) or ["vim"])
 
 # ----------- ANSI -----------
 ANSI = {
@@ -32,21 +40,89 @@ def apply_no_color():
     ANSI[k] = ""
 
 # ----------- IO helpers -----------
-def atomic_write(path: Path, data: str):
-  path.parent.mkdir(parents=True, exist_ok=True)
+_ensured_dirs = set()   # parent dirs already created/checked in this process
+
+def atomic_write_json(path: Path, obj, **dump_kw):
+  # json.dump straight into the temp file (no intermediate str), then replace
+  if path.parent not in _ensured_dirs:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    _ensured_dirs.add(path.parent)
   tmp = path.with_name(".tmp-"+path.name)
-  tmp.write_text(data, encoding="utf-8")
+  with open(tmp, "w", encoding="utf-8") as f:
+    json.dump(obj, f, ensure_ascii=False, **dump_kw)
   tmp.replace(path)
+  _json_cache.pop(path, None)   # own writes may land within the same mtime tick
+
+# REPL session: machine-only files (compact saves) stay in memory and are written once at exit
+_deferred_json = None
+
+def defer_json_writes():
+  global _deferred_json
+  if _deferred_json is None:
+    _deferred_json = {}
+    atexit.register(flush_deferred_json)
+    # atexit does not run on a closed terminal (SIGHUP) or SIGTERM: flush there too
+    for name in ("SIGHUP", "SIGTERM"):
+      sig = getattr(signal, name, None)
+      if sig is not None:
+        signal.signal(sig, _flush_and_exit)
+
+def _flush_and_exit(signum, frame):
+  flush_deferred_json()
+  sys.exit(128 + signum)
+
+def flush_deferred_json():
+  if not _deferred_json: return
+  for path, obj in list(_deferred_json.items()):
+    try:
+      atomic_write_json(path, obj, separators=(",", ":"))
+      del _deferred_json[path]
+    except Exception as e:
+      print("Warn:", e, file=sys.stderr)
+
+def _file_stamp(path):
+  # st_ino: rpn.js and atomic_write_json save via tmp file + rename, so a rewrite
+  # in the same mtime tick with the same size still gets a new stamp
+  try:
+    st = path.stat()
+    return (st.st_ino, st.st_mtime_ns, st.st_size)
+  except OSError:
+    return None
+
+_json_cache = {}   # path -> ((ino, mtime_ns, size), parsed); callers must not mutate the result
+
+def _parse_json(raw: bytes):
+  if orjson is not None:
+    try: return orjson.loads(raw)
+    except orjson.JSONDecodeError: pass   # e.g. NaN/Infinity written by json.dump
+  return json.loads(raw)
 
 def load_json(path: Path, default):
+  """Parsed JSON, re-read only when the file stamp changed (completer and REPL hit this per input)."""
+  if _deferred_json and path in _deferred_json:
+    return _deferred_json[path]
   try:
-    return json.loads(path.read_text(encoding="utf-8"))
+    stamp = _file_stamp(path)
+    hit = _json_cache.get(path)
+    if stamp is not None and hit and hit[0] == stamp:
+      return hit[1]
+    with open(path, "rb") as f:
+      data = _parse_json(f.read())
+    _json_cache[path] = (stamp, data)
+    return data
   except Exception:
     return default
 
-def save_json(path: Path, obj):
+def save_json(path: Path, obj, compact=False):
+  # compact: machine-only files (state, result stack), no indent
+  if compact and _deferred_json is not None:
+    _deferred_json[path] = obj
+    return
   try:
-    atomic_write(path, json.dumps(obj, indent=2, ensure_ascii=False))
+    if compact:
+      atomic_write_json(path, obj, separators=(",", ":"))
+    else:
+      atomic_write_json(path, obj, indent=2)
   except Exception as e:
     print("Warn:", e, file=sys.stderr)
 
@@ -62,7 +138,7 @@ def load_state_vars() -> list:
   return [0]*10
 
 def save_state_vars(vars_list: list):
-  save_json(STATE_PATH, {"vars": list(map(float, vars_list))})
+  save_json(STATE_PATH, {"vars": list(map(float, vars_list))}, compact=True)
 
 # simvars structure stored as { "simvars": { "A": {...}, "L": {...}, ... } }
 # compatibility: legacy top-level scalars inside "simvars" map to A:
@@ -81,13 +157,20 @@ def load_simvars() -> dict:
 def save_simvars(sim: dict):
   save_json(SIM_PATH, {"simvars": sim})
 
+# parsed functions, reused while FUNC_PATH is unchanged (REPL, TAB completion)
+_FUNCS_CACHE = {"stamp": None, "data": []}
+
 def load_funcs() -> list:
+  stamp = _file_stamp(FUNC_PATH)
+  if stamp is not None and stamp == _FUNCS_CACHE["stamp"]:
+    return _FUNCS_CACHE["data"]
   arr = load_json(FUNC_PATH, [])
-  if not isinstance(arr, list): return []
+  if not isinstance(arr, list): arr = []
   out = []
   for f in arr:
     if isinstance(f, dict) and "name" in f and "params" in f and "rpn" in f:
       out.append({"name":str(f["name"]), "params": int(f["params"]), "rpn": str(f["rpn"])})
+  _FUNCS_CACHE["stamp"] = stamp; _FUNCS_CACHE["data"] = out
   return out
 
 def load_results() -> list:
@@ -96,42 +179,54 @@ def load_results() -> list:
   return [r for r in arr if isinstance(r, list)]
 
 def save_results(results: list):
-  save_json(STACK_PATH, {"results": results[:8]})
+  save_json(STACK_PATH, {"results": results[:8]}, compact=True)
 
 # ----------- Tokenizer & param helpers -----------
+# one C-level scan per token: (..) with up to one nested level, if{ else{ } and plain words;
+# a bare "(" (deeper nesting or unbalanced) falls back to the depth-counting scan below
+_TOKEN_RE = re.compile(r"\s*(\((?:[^()]|\([^()]*\))*\)|if\{|else\{|[{})]|\(|[^\s(){}]+)")
+NUM_RE   = re.compile(r"[-+]?\d+(?:[.,]\d+)?")
+RES_RE   = re.compile(r"r(\d+)?(,\d+)?")
+
 def tokenize(src: str):
+  # plain words only (no SimVars or blocks): C-level split, no regex at all
+  if "(" not in src and ")" not in src and "{" not in src and "}" not in src:
+    return src.split()
+  tokens = _TOKEN_RE.findall(src)
+  if "(" not in tokens:
+    return tokens
+  # rare: nesting deeper than one level or unbalanced "(" -> rescan with depth counting
   tokens = []
-  i = 0
+  append = tokens.append
+  match = _TOKEN_RE.match
+  pos = 0
   n = len(src)
-  while i < n:
-    ch = src[i]
-    if ch.isspace():
-      i += 1; continue
-    if ch == '(':
+  while pos < n:
+    m = match(src, pos)
+    if m is None:
+      break  # only trailing whitespace left
+    tok = m.group(1)
+    if tok == "(":
+      i = m.start(1)
+      # jump from paren to paren with str.find instead of inspecting every character
       depth = 1; j = i+1
-      while j < n and depth > 0:
-        if src[j] == '(':
-          depth += 1
-        elif src[j] == ')':
-          depth -= 1
-        j += 1
-      tokens.append(src[i:j])
-      i = j; continue
-    if src.startswith("if{", i):
-      tokens.append("if{"); i += 3; continue
-    if src.startswith("else{", i):
-      tokens.append("else{"); i += 5; continue
-    if ch == '}':
-      tokens.append('}'); i += 1; continue
-    j = i
-    while j < n and (not src[j].isspace()) and src[j] not in "(){}":
-      j += 1
-    tokens.append(src[i:j])
-    i = j
-  return [t for t in tokens if t]
+      while depth > 0:
+        c = src.find(")", j)
+        if c < 0:
+          j = n; break   # unbalanced: the group runs to the end
+        o = src.find("(", j, c)
+        if o < 0:
+          depth -= 1; j = c+1
+        else:
+          depth += 1; j = o+1
+      append(src[i:j])
+      pos = j; continue
+    append(tok)
+    pos = m.end()
+  return tokens
 
 def is_number_token(t: str) -> bool:
-  return re.fullmatch(r"[-+]?\d+(?:[.,]\d+)?", t or "") is not None
+  return NUM_RE.fullmatch(t or "") is not None
 
 def parse_number(t: str) -> float:
   return float(t.replace(",", "."))
@@ -142,11 +237,17 @@ def to_num(v):
   except: return 0.0
 
 def is_pure_r_token_expression(src: str) -> bool:
-  toks = tokenize(src or "")
-  return len(toks) == 1 and re.fullmatch(r"r(\d+)?(,\d+)?", toks[0]) is not None
+  return is_pure_r_tokens(tokenize(src or ""))
+
+def is_pure_r_tokens(toks) -> bool:
+  return len(toks) == 1 and RES_RE.fullmatch(toks[0]) is not None
+
+def is_param_token(t: str) -> bool:
+  # pN without a regex (same digits as \d: str.isdecimal)
+  return t[:1] == "p" and t[1:].isdecimal()
 
 def collect_missing_params(tokens, existing_params):
-  needed = sorted({t for t in tokens if re.fullmatch(r"p\d+", t)}, key=lambda x:int(x[1:]))
+  needed = sorted({t for t in tokens if is_param_token(t)}, key=lambda x:int(x[1:]))
   missing = [t for t in needed if t not in existing_params]
   return missing
 
@@ -179,259 +280,453 @@ def find_block_end(toks, open_index):
     i += 1
   raise RuntimeError("Fehlende schließende '}' ab Index %d" % open_index)
 
+def block_ends(toks, start=0):
+  """{opener index: matching '}' index} for all if{/else{ from start on, in one pass
+  (same pairing as find_block_end: an opener's end only depends on the tokens after it)."""
+  ends = {}
+  opens = []
+  for i in range(start, len(toks)):
+    t = toks[i]
+    if t in ("if{", "else{"):
+      opens.append(i)
+    elif t == "}" and opens:
+      ends[opens.pop()] = i
+  return ends
+
 # ----------- Precompile functions -----------
 def precompile_tokens(tokens, functions):
-  func_map = {f["name"]: f for f in functions}
-  changed = True
-  out = tokens[:]
-  while changed:
-    changed = False
-    nxt = []
-    for t in out:
-      f = func_map.get(t)
-      if not f:
-        nxt.append(t); continue
-      body = [x for x in tokenize(f["rpn"]) if not re.fullmatch(r"p\d+", x)]
-      body = precompile_tokens(body, functions)
-      nxt.extend(body)
-      changed = True
-    out = nxt
-  return out
-
-# ----------- Evaluator -----------
+  return list(_precompile_cached(tuple(tokens), _funcs_key(functions)))
+
+@functools.lru_cache(maxsize=256)
+def _precompile_cached(tokens, funcs_key):
+  # single pass: every function body is tokenized and expanded once (memo), recursion is an error
+  funcs = _func_table(funcs_key)
+  memo = {}
+  visiting = set()
+  def expand(name):
+    if name in memo: return memo[name]
+    if name in visiting:
+      raise RuntimeError(f"Funktion '{name}' ruft sich selbst auf (precompile nicht möglich)")
+    visiting.add(name)
+    out = []
+    for x in tokenize(funcs[name][1]):
+      if x in funcs: out.extend(expand(x))
+      elif not is_param_token(x): out.append(x)
+    visiting.discard(name)
+    memo[name] = out
+    return out
+  out = []
+  for t in tokens:
+    if t in funcs: out.extend(expand(t))
+    else: out.append(t)
+  return tuple(out)
+
+# ----------- Bytecode compiler + VM -----------
+# compile_rpn() turns the token list into a flat list of (opcode, arg) once; exec_rpn() runs it.
+# if{/else{ become jumps resolved at compile time, register/param/result tokens are decoded once.
 SIM_RE = re.compile(r"^\((>?)([A-Za-z]+):(.*)\)$")
 
-def evaluate_rpn(src: str, *, vars_state=None, params=None, simvars=None, functions=None, results_history=None):
-  tokens = tokenize(src or "")
-  stack = []
-  regs = [0.0]*10
-  vars_state = list(vars_state or [0.0]*10)
-  params = dict(params or {})
-  simvars = dict(simvars or {})
-  functions = list(functions or [])
-  results_history = list(results_history or [])
-  func_map = {f["name"]: f for f in functions}
-  sim_dirty = False
-
-  def push(v): stack.append(v)
-  def pop():
-    if not stack: raise RuntimeError("stack underflow")
-    return stack.pop()
-  def pop2():
-    if len(stack) < 2: raise RuntimeError("stack underflow")
-    b = stack.pop(); a = stack.pop(); return a,b
-  def pop3():
-    if len(stack) < 3: raise RuntimeError("stack underflow")
-    c = stack.pop(); b = stack.pop(); a = stack.pop(); return a,b,c
-
-  def get_sim(prefix, key):
-    if prefix == "A":
-      if prefix in simvars and key in simvars[prefix]:
-        return simvars[prefix][key]
-      if key in simvars and isinstance(simvars[key], (int,float)):
-        return simvars[key]
-      return 0.0
-    return simvars.get(prefix, {}).get(key, 0.0)
-
-  def set_sim(prefix, key, val):
-    nonlocal sim_dirty
-    simvars.setdefault(prefix, {})[key] = float(val)
-    sim_dirty = True
-
+(OP_NUM, OP_PARAM, OP_RES, OP_STORE_VAR, OP_LOAD_VAR, OP_STORE_REG, OP_LOAD_REG,
+ OP_SIM_GET, OP_SIM_SET, OP_JZ, OP_JMP, OP_CALL, OP_UNKNOWN, OP_ERR) = range(14)
+
+# pure stack operators: handler(stack) via HANDLERS[op - OP_FIRST_STACK]
+OP_FIRST_STACK = 16
+
+# handler factories around C-level callables (operator/math/builtins); one Python frame per op
+def _bin(fn):
+  def h(st):
+    b = st.pop(); a = st.pop(); st.append(fn(a, b))
+  return h
+
+def _binf(fn):
+  def h(st):
+    b = st.pop(); a = st.pop(); st.append(float(fn(a, b)))
+  return h
+
+def _cmp(fn):
+  def h(st):
+    b = st.pop(); a = st.pop(); st.append(1.0 if fn(a, b) else 0.0)
+  return h
+
+def _un(fn):
+  def h(st):
+    st.append(fn(st.pop()))
+  return h
+
+def _unf(fn):
+  def h(st):
+    st.append(float(fn(st.pop())))
+  return h
+
+def _clamp(st):
+  v = st.pop(); hi = st.pop(); lo = st.pop()
+  st.append(float(max(lo, min(hi, v))))
+
+STACK_OPS = {
+  "+": _bin(operator.add),
+  "-": _bin(operator.sub),
+  "*": _bin(operator.mul),
+  "/": _bin(operator.truediv),
+  "%": _bin(operator.mod),
+  "^": _bin(operator.pow),
+  "==": _cmp(operator.eq),
+  "!=": _cmp(operator.ne),
+  ">": _cmp(operator.gt),
+  "<": _cmp(operator.lt),
+  ">=": _cmp(operator.ge),
+  "<=": _cmp(operator.le),
+  "and": _cmp(lambda a,b: a!=0 and b!=0),
+  "or": _cmp(lambda a,b: a!=0 or b!=0),
+  "not": _un(lambda a: 0.0 if a!=0 else 1.0),
+  "round": _unf(round),
+  "floor": _unf(math.floor),
+  "ceil": _unf(math.ceil),
+  "abs": _unf(abs),
+  "sin": _unf(math.sin),
+  "cos": _unf(math.cos),
+  "tan": _unf(math.tan),
+  "log": _unf(math.log),
+  "exp": _unf(math.exp),
+  "min": _binf(min),
+  "max": _binf(max),
+  "clamp": _clamp,
+  "pow2": _unf(lambda a: a**2),
+  "pow": _binf(operator.pow),
+  "sqrt2": _unf(math.sqrt),
+  "sqrt": _binf(lambda a,b: a ** (1.0/b)),
+  "dnor": _unf(lambda a: ((a % 360.0) + 360.0) % 360.0),
+}
+OP_ALIASES = {"=": "==", "<>": "!=", "&&": "and", "||": "or", "!": "not"}
+HANDLERS = list(STACK_OPS.values())
+STACK_OPCODES = {name: OP_FIRST_STACK + i for i, name in enumerate(STACK_OPS)}
+for _alias, _name in OP_ALIASES.items():
+  STACK_OPCODES[_alias] = STACK_OPCODES[_name]
+NOP_TOKENS = {"Number", "Boolean", ","}
+# first three stack opcodes, run inline by exec_rpn (relies on STACK_OPS order)
+OP_ADD, OP_SUB, OP_MUL = STACK_OPCODES["+"], STACK_OPCODES["-"], STACK_OPCODES["*"]
+assert (OP_ADD, OP_SUB, OP_MUL) == (OP_FIRST_STACK, OP_FIRST_STACK + 1, OP_FIRST_STACK + 2)
+
+def _funcs_key(functions):
+  return tuple((f["name"], int(f["params"]), f["rpn"]) for f in functions or [])
+
+@functools.lru_cache(maxsize=32)
+def _func_table(funcs_key):
+  # name -> (params, rpn); a name defined twice resolves to its last definition everywhere
+  return {name: (k, rpn) for name, k, rpn in funcs_key}
+
+# Operanden-Token -> (opcode, arg) oder None; ein Decoder je erstem Zeichen, damit pro Token
+# höchstens ein Regex läuft (s/l/sp/lp/pN ganz ohne Regex)
+def _dec_num(t):
+  return (OP_NUM, parse_number(t)) if NUM_RE.fullmatch(t) else None
+
+def _dec_slot(t):
+  c0 = t[0]; tail = t[1:]
+  if tail.isdecimal():
+    kind, idx = (OP_STORE_VAR if c0 == "s" else OP_LOAD_VAR), int(tail)
+  elif tail[:1] == "p" and tail[1:].isdecimal():
+    kind, idx = (OP_STORE_REG if c0 == "s" else OP_LOAD_REG), int(tail[1:])
+  else:
+    return None
+  if idx < NUM_SLOTS: return (kind, idx)
+  # out of range: loads read 0, stores fail when executed (same as before, but checked once here)
+  if c0 == "l": return (OP_NUM, 0.0)
+  name = "s" if kind == OP_STORE_VAR else "sp"
+  return (OP_ERR, f"{name}{idx}: nur {name}0..{name}{NUM_SLOTS-1} vorhanden")
+
+def _dec_param(t):
+  return (OP_PARAM, int(t[1:])) if is_param_token(t) else None
+
+def _dec_res(t):
+  m = RES_RE.fullmatch(t)
+  if not m: return None
+  ri = int(m.group(1)) if m.group(1) else 1
+  si = int(m.group(2)[1:]) if m.group(2) else None
+  return (OP_RES, (ri, si))
+
+def _dec_sim(t):
+  m = SIM_RE.fullmatch(t)
+  if not m: return None
+  return (OP_SIM_SET if m.group(1) == ">" else OP_SIM_GET, (m.group(2), m.group(3).strip()))
+
+_OPERAND_DECODERS = {c: _dec_num for c in "0123456789+-"}
+_OPERAND_DECODERS.update({"s": _dec_slot, "l": _dec_slot, "p": _dec_param, "r": _dec_res, "(": _dec_sim})
+
+def _operand(t):
+  dec = _OPERAND_DECODERS.get(t[0])
+  if dec is None:
+    if not t[0].isdecimal(): return None   # non-ASCII digits still count as numbers
+    dec = _dec_num
+  return dec(t)
+
+# every other fixed token in one table: stack-op opcode (int), or "if"/"else"/"nop"
+TOKEN_TABLE = dict(STACK_OPCODES)
+TOKEN_TABLE.update({"if{": "if", "else{": "else"})
+TOKEN_TABLE.update(dict.fromkeys(NOP_TOKENS, "nop"))
+
+def _compile_tokens(tokens, funcs_key):
+  funcs = _func_table(funcs_key)
+  n = len(tokens)
+  match = block_ends(tokens)
+
+  code = []
+  blocks = []   # open blocks: [kind, patch_pos, close_index]
+  barrier = 0   # first code index that constant folding may touch (nothing jumps past it)
   i = 0
-  while i < len(tokens):
+  while i < n:
     t = tokens[i]
-    if is_number_token(t):
-      push(parse_number(t)); i += 1; continue
-
-    # params pN (no prompting here; must be injected before evaluate_rpn)
-    if re.fullmatch(r"p\d+", t):
-      push(to_num(params.get(t, 0))); i += 1; continue
-
-    m = re.fullmatch(r"r(\d+)?(,\d+)?", t)
-    if m:
-      ri = int(m.group(1)) if m.group(1) else 1
-      si = int(m.group(2)[1:]) if m.group(2) else None
-      if ri - 1 >= len(results_history) or ri <= 0:
-        raise RuntimeError(f"r: kein gespeichertes Ergebnis r{ri}")
-      res = results_history[ri-1]
-      if si is None:
-        for v in res: push(v)
-      else:
-        if si-1 < 0 or si-1 >= len(res):
-          raise RuntimeError(f"r: kein Wert an Position {si}")
-        push(res[si-1])
+    if blocks and i == blocks[-1][2]:
+      kind, pos, _ = blocks.pop()
+      if kind == "if_else":
+        # end of IF body: jump over ELSE body, JZ lands at start of ELSE body
+        else_start = i + 1
+        code.append((OP_JMP, None))
+        code[pos] = (OP_JZ, len(code))
+        blocks.append(["end", len(code) - 1, match[else_start]])
+        barrier = len(code)
+        i = else_start + 1
+        continue
+      code[pos] = (code[pos][0], len(code))
+      barrier = len(code)
       i += 1; continue
 
-    if re.fullmatch(r"s\d+", t):
-      n = int(t[1:])
-      val = pop()
-      vars_state[n] = float(val)
-      i += 1; continue
-    if re.fullmatch(r"l\d+", t):
-      n = int(t[1:])
-      push(to_num(vars_state[n] if n < len(vars_state) else 0))
+    if (op := _operand(t)) is not None:
+      code.append(op)
       i += 1; continue
+    kind = TOKEN_TABLE.get(t)
+    if kind == "if":
+      end_if = match.get(i)
+      has_else = end_if is not None and end_if + 1 < n and tokens[end_if+1] == "else{"
+      if end_if is None or (has_else and (end_if + 1) not in match):
+        bad = i if end_if is None else end_if + 1
+        code.append((OP_ERR, "Fehlende schließende '}' ab Index %d" % bad))
+        break
+      code.append((OP_JZ, None))
+      blocks.append(["if_else" if has_else else "end", len(code) - 1, end_if])
+    elif kind == "else":
+      # else{ without preceding if{: body is skipped
+      if i not in match:
+        code.append((OP_ERR, "Fehlende schließende '}' ab Index %d" % i))
+        break
+      code.append((OP_JMP, None))
+      blocks.append(["end", len(code) - 1, match[i]])
+    elif t in funcs:
+      code.append((OP_CALL, (t, funcs[t][0])))
+    elif type(kind) is int:
+      opc = kind
+      # constant folding: operator on literal operands (at most 3, clamp) -> result literal
+      j = len(code)
+      while j > barrier and j > len(code) - 3 and code[j-1][0] == OP_NUM: j -= 1
+      if j < len(code):
+        vals = [a for _, a in code[j:]]
+        try:
+          HANDLERS[opc - OP_FIRST_STACK](vals)
+        except Exception:
+          vals = None   # underflow/domain error: leave it to run time
+        if vals is not None:
+          code[j:] = [(OP_NUM, v) for v in vals]
+          i += 1; continue
+      code.append((opc, None))
+    elif kind == "nop":
+      pass
+    else:
+      code.append((OP_UNKNOWN, t))
+    i += 1
+  return code
 
-    if re.fullmatch(r"sp\d+", t):
-      n = int(t[2:])
-      val = stack[-1] if stack else 0
-      regs[n] = float(val)
-      i += 1; continue
-    if re.fullmatch(r"lp\d+", t):
-      n = int(t[2:])
-      push(to_num(regs[n] if n < len(regs) else 0))
-      i += 1; continue
+@functools.lru_cache(maxsize=256)
+def _compile_cached(src, funcs_key):
+  tokens = tokenize(src)
+  return tuple(_compile_tokens(tokens, funcs_key)), tuple(tokens)
 
-    m2 = SIM_RE.fullmatch(t)
-    if m2:
-      write = m2.group(1) == ">"
-      prefix = m2.group(2)
-      key = m2.group(3).strip()
-      if write:
-        val = pop()
-        set_sim(prefix, key, val)
-      else:
-        push(get_sim(prefix, key))
-      i += 1; continue
+@functools.lru_cache(maxsize=256)
+def _compile_token_tuple(tokens, funcs_key):
+  return tuple(_compile_tokens(tokens, funcs_key))
 
-    if t == "if{":
-      end_if = find_block_end(tokens, i)
-      has_else = False; else_start = -1; end_else = -1
-      if end_if + 1 < len(tokens) and tokens[end_if+1] == "else{":
-        has_else = True; else_start = end_if + 1; end_else = find_block_end(tokens, else_start)
-      cond = pop()
-      if to_num(cond) != 0:
-        body = tokens[i+1:end_if]
-        evaluate_rpn(" ".join(body), vars_state=vars_state, params=params, simvars=simvars, functions=functions, results_history=[])
-        i = (end_else + 1) if has_else else (end_if + 1)
-      else:
-        if has_else:
-          body = tokens[else_start+1:end_else]
-          evaluate_rpn(" ".join(body), vars_state=vars_state, params=params, simvars=simvars, functions=functions, results_history=[])
-          i = end_else + 1
+@functools.lru_cache(maxsize=256)
+def _compile_func(name, funcs_key):
+  return tuple(_compile_tokens(tokenize(_func_table(funcs_key)[name][1]), funcs_key))
+
+def compile_rpn(src: str, functions):
+  """(code, tokens) for src; cached per (src, function definitions)."""
+  return _compile_cached(src or "", _funcs_key(functions))
+
+MAX_CALL_DEPTH = 500
+# s0..s9 / sp0..sp9 as unboxed doubles; fresh banks are a memcpy of this template
+NUM_SLOTS = 10
+_ZERO_SLOTS = array.array("d", [0.0]*NUM_SLOTS)
+
+def exec_rpn(code, funcs_key, *, vars_state, params, simvars, results_history):
+  """Run compiled code. vars_state/simvars are modified in place; returns (stack, regs, sim_dirty).
+  Function calls push a frame (own stack, regs, params) instead of recursing."""
+  stack = []
+  regs = _ZERO_SLOTS[:]
+  sim_dirty = False
+  push = stack.append
+  pop = stack.pop
+  n = len(code)
+  ip = 0
+  frames = []
+  try:
+    while True:
+      if ip >= n:
+        if not frames: break
+        # end of function body: its stack values go onto the caller's stack
+        sub = stack
+        code, ip, stack, regs, params = frames.pop()
+        n = len(code); push = stack.append; pop = stack.pop
+        stack.extend(sub)
+        continue
+      op, arg = code[ip]
+      ip += 1
+      if op >= OP_FIRST_STACK:
+        if op <= OP_MUL:
+          # + - * inline: the most frequent ops skip the handler call
+          b = pop(); a = pop()
+          push(a + b if op == OP_ADD else (a - b if op == OP_SUB else a * b))
         else:
-          i = end_if + 1
-      continue
-    if t == "else{":
-      end_else = find_block_end(tokens, i)
-      i = end_else + 1; continue
-
-    f_map = {f["name"]: f for f in functions}
-    f = f_map.get(t)
-    if f:
-      k = int(f["params"])
-      if len(stack) < k: raise RuntimeError(f"function '{f['name']}' benötigt {k} Parameter")
-      args = [0]*k
-      for idx in range(k-1, -1, -1):
-        args[idx] = stack.pop()
-      sub_toks = []
-      for tok in tokenize(f["rpn"]):
-        m = re.fullmatch(r"p(\d+)", tok)
-        if m:
-          sub_toks.append(str(args[int(m.group(1))-1] if 1 <= int(m.group(1)) <= k else 0))
+          HANDLERS[op - OP_FIRST_STACK](stack)
+      elif op == OP_NUM:
+        push(arg)
+      elif op == OP_JZ:
+        if pop() == 0: ip = arg
+      elif op == OP_JMP:
+        ip = arg
+      elif op == OP_LOAD_VAR:
+        push(vars_state[arg])
+      elif op == OP_STORE_VAR:
+        vars_state[arg] = pop()
+      elif op == OP_LOAD_REG:
+        push(regs[arg])
+      elif op == OP_STORE_REG:
+        regs[arg] = stack[-1] if stack else 0.0
+      elif op == OP_PARAM:
+        push(params.get(arg, 0.0))
+      elif op == OP_SIM_GET:
+        prefix, key = arg
+        if prefix == "A":
+          if prefix in simvars and key in simvars[prefix]: v = simvars[prefix][key]
+          elif key in simvars and isinstance(simvars[key], (int,float)): v = simvars[key]
+          else: v = 0.0
         else:
-          sub_toks.append(tok)
-      sub_expr = " ".join(sub_toks)
-      sub = evaluate_rpn(sub_expr, vars_state=vars_state, params=params, simvars=simvars, functions=functions, results_history=[])
-      for v in sub["stack"]:
-        push(v)
-      i += 1; continue
-
-    def binop(fn):
-      a,b = pop2(); push(fn(to_num(a), to_num(b)))
-    def unop(fn):
-      a = pop(); push(fn(to_num(a)))
-
-    if t == "+": binop(lambda a,b:a+b)
-    elif t == "-": binop(lambda a,b:a-b)
-    elif t == "*": binop(lambda a,b:a*b)
-    elif t == "/": binop(lambda a,b:a/b)
-    elif t == "%": binop(lambda a,b:a%b)
-    elif t == "^": binop(lambda a,b: a**b)
-    elif t in ("==","="): binop(lambda a,b: 1.0 if a==b else 0.0)
-    elif t in ("!=","<>"): binop(lambda a,b: 1.0 if a!=b else 0.0)
-    elif t == ">": binop(lambda a,b: 1.0 if a>b else 0.0)
-    elif t == "<": binop(lambda a,b: 1.0 if a<b else 0.0)
-    elif t == ">=": binop(lambda a,b: 1.0 if a>=b else 0.0)
-    elif t == "<=": binop(lambda a,b: 1.0 if a<=b else 0.0)
-    elif t in ("and","&&"): binop(lambda a,b: 1.0 if (a!=0 and b!=0) else 0.0)
-    elif t in ("or","||"): binop(lambda a,b: 1.0 if (a!=0 or b!=0) else 0.0)
-    elif t in ("not","!"): unop(lambda a: 0.0 if a!=0 else 1.0)
-    elif t == "round": unop(lambda a: float(round(a)))
-    elif t == "floor": unop(lambda a: float(math.floor(a)))
-    elif t == "ceil":  unop(lambda a: float(math.ceil(a)))
-    elif t == "abs":   unop(lambda a: float(abs(a)))
-    elif t == "sin":   unop(lambda a: float(math.sin(a)))
-    elif t == "cos":   unop(lambda a: float(math.cos(a)))
-    elif t == "tan":   unop(lambda a: float(math.tan(a)))
-    elif t == "log":   unop(lambda a: float(math.log(a)))
-    elif t == "exp":   unop(lambda a: float(math.exp(a)))
-    elif t == "min":   binop(lambda a,b: float(min(a,b)))
-    elif t == "max":   binop(lambda a,b: float(max(a,b)))
-    elif t == "clamp":
-      v = pop(); hi = pop(); lo = pop()
-      push(float(max(lo, min(hi, v))))
-    elif t == "pow2": unop(lambda a: float(a**2))
-    elif t == "pow":  binop(lambda a,b: float(a**b))
-    elif t == "sqrt2": unop(lambda a: float(math.sqrt(a)))
-    elif t == "sqrt":  binop(lambda a,b: float(a ** (1.0/b)))
-    elif t == "dnor": unop(lambda a: float(((a % 360.0) + 360.0) % 360.0))
-    elif t in ("Number","Boolean",","):
-      pass
-    else:
-      raise RuntimeError("Unknown token: "+t)
-    i += 1
+          v = simvars.get(prefix, {}).get(key, 0.0)
+        push(to_num(v))
+      elif op == OP_SIM_SET:
+        prefix, key = arg
+        simvars.setdefault(prefix, {})[key] = float(pop())
+        sim_dirty = True
+      elif op == OP_RES:
+        ri, si = arg
+        if ri - 1 >= len(results_history) or ri <= 0:
+          raise RuntimeError(f"r: kein gespeichertes Ergebnis r{ri}")
+        res = results_history[ri-1]
+        if si is None:
+          for v in res: push(to_num(v))
+        else:
+          if si-1 < 0 or si-1 >= len(res):
+            raise RuntimeError(f"r: kein Wert an Position {si}")
+          push(to_num(res[si-1]))
+      elif op == OP_CALL:
+        name, k = arg
+        if len(stack) < k: raise RuntimeError(f"function '{name}' benötigt {k} Parameter")
+        if len(frames) >= MAX_CALL_DEPTH: raise RuntimeError(f"function '{name}': zu tiefe Aufrufverschachtelung")
+        args = stack[len(stack)-k:]
+        del stack[len(stack)-k:]
+        frames.append((code, ip, stack, regs, params))
+        code = _compile_func(name, funcs_key); n = len(code); ip = 0
+        stack = []; push = stack.append; pop = stack.pop
+        regs = _ZERO_SLOTS[:]
+        params = dict(enumerate(args, 1))
+      elif op == OP_UNKNOWN:
+        raise RuntimeError("Unknown token: "+arg)
+      elif op == OP_ERR:
+        raise RuntimeError(arg)
+  except IndexError:
+    raise RuntimeError("stack underflow") from None
+  return stack, regs, sim_dirty
 
+def evaluate_rpn(src: str, *, vars_state=None, params=None, simvars=None, functions=None, results_history=None):
+  fkey = _funcs_key(functions)
+  code, tokens = _compile_cached(src or "", fkey)
+  return _run_compiled(code, tokens, fkey, vars_state, params, simvars, functions, results_history)
+
+def evaluate_rpn_tokens(tokens, *, vars_state=None, params=None, simvars=None, functions=None, results_history=None):
+  """evaluate_rpn for an already tokenized expression (REPL/CLI tokenize each input once)."""
+  fkey = _funcs_key(functions)
+  tokens = tuple(tokens)
+  return _run_compiled(_compile_token_tuple(tokens, fkey), tokens, fkey, vars_state, params, simvars, functions, results_history)
+
+def _run_compiled(code, tokens, fkey, vars_state, params, simvars, functions, results_history):
+  functions = functions or []
+  # always exactly NUM_SLOTS doubles, so the VM indexes without bounds checks
+  vars_state = array.array("d", vars_state[:NUM_SLOTS]) if vars_state else _ZERO_SLOTS[:]
+  if len(vars_state) < NUM_SLOTS: vars_state.extend(_ZERO_SLOTS[len(vars_state):])
+  simvars = dict(simvars or {})
+  results_history = results_history or []   # read-only
+  # pN -> N, values as numbers
+  pvals = {int(k[1:]): to_num(v) for k, v in (params or {}).items() if is_param_token(str(k))}
+  vars_before = vars_state[:]
+  stack, regs, sim_dirty = exec_rpn(code, fkey, vars_state=vars_state, params=pvals,
+                                    simvars=simvars, results_history=results_history)
   return {
     "stack": stack,
     "regs": regs,
     "vars": vars_state,
+    "vars_dirty": vars_state != vars_before,
     "simvars": simvars,
     "sim_dirty": sim_dirty,
     "functions": functions,
-    "original_tokens": tokens
+    "original_tokens": list(tokens)
   }
 
 # ----------- Step visualizer -----------
-UN_OPS = {"not","!","round","floor","ceil","abs","sin","cos","tan","log","exp","sqrt2","pow2","dnor"}
-BIN_OPS = {"+","-","*","/","%","^",">","<",">=","<=","==","=","!=","<>","and","&&","or","||","min","max","pow","sqrt"}
+UN_OPS = frozenset({"not","!","round","floor","ceil","abs","sin","cos","tan","log","exp","sqrt2","pow2","dnor"})
+BIN_OPS = frozenset({"+","-","*","/","%","^",">","<",">=","<=","==","=","!=","<>","and","&&","or","||","min","max","pow","sqrt"})
+# operator -> arity, so the step scan needs one dict probe per token instead of up to three set probes
+OP_ARITY = {**dict.fromkeys(UN_OPS, 1), **dict.fromkeys(BIN_OPS, 2), "clamp": 3}
 
 def fmt_num(v):
-  if isinstance(v, (int,float)) and abs(v - round(v)) < 1e-12:
-    return str(int(round(v)))
+  t = type(v)
+  if t is int: return str(v)
+  if t is not float:
+    try: v = float(v)
+    except: return str(v)
+  if v.is_integer(): return str(int(v))
+  # near-integers (float noise below 1e-12) still print as integers; inf/nan as text
   try:
-    f = float(v); 
-    if abs(f - round(f)) < 1e-12: return str(int(round(f)))
-    return str(f)
-  except: return str(v)
-
-SIM_RE = re.compile(r"^\((>?)([A-Za-z]+):(.*)\)$")
+    r = round(v)
+    if abs(v - r) < 1e-12: return str(r)
+  except (OverflowError, ValueError):
+    pass
+  return str(v)
 
 def step_verbose(tokens, *, vars_state, regs, simvars, functions, no_color=False, marker=False, endstep=False, infix=False):
   if no_color: apply_no_color()
 
   func_map = {f["name"]: f for f in functions}
-  def token_is_value(t):
-    if is_number_token(t): return True
-    if re.fullmatch(r"l\d+", t): return True
-    if re.fullmatch(r"lp\d+", t): return True
-    if SIM_RE.fullmatch(t): return True
-    return False
+  # Teilauswertungen brauchen nur dann eine eigene SimVar-Kopie, wenn sie schreiben können:
+  # direkt über (>...) oder über eine Funktion, deren Körper (>...) enthält
+  funcs_write_sim = any("(>" in f["rpn"] for f in functions)
+  def sim_for(body):
+    if any(t.startswith("(>") or (funcs_write_sim and t in func_map) for t in body):
+      return copy.deepcopy(simvars)
+    return simvars
 
   def token_value(t):
-    if is_number_token(t): return parse_number(t)
-    if re.fullmatch(r"l\d+", t): return float(vars_state[int(t[1:])])
-    if re.fullmatch(r"lp\d+", t): return float(regs[int(t[2:])])
-    m = SIM_RE.fullmatch(t)
-    if m:
-      pref = m.group(2); key = m.group(3).strip()
+    # value of a number/sN/lN/(A:..) token, None for anything else; one operand decode per token
+    op = _operand(t)
+    if op is None: return None
+    kind = op[0]
+    if kind == OP_NUM: return op[1]
+    if kind == OP_LOAD_VAR: return float(vars_state[op[1]])
+    if kind == OP_LOAD_REG: return float(regs[op[1]])
+    if kind == OP_SIM_GET or kind == OP_SIM_SET:
+      pref, key = op[1]
       if pref == "A":
         if pref in simvars and key in simvars[pref]: return float(simvars[pref][key])
         if key in simvars and isinstance(simvars[key], (int,float)): return float(simvars[key])
         return 0.0
       return float(simvars.get(pref, {}).get(key, 0.0))
-    raise RuntimeError("Token not a value: "+t)
+    return None
 
   def color(text, style):
     if style == "Y": return ANSI["yellow"] + text + ANSI["reset"]
@@ -460,28 +755,40 @@ def step_verbose(tokens, *, vars_state, regs, simvars, functions, no_color=False
     return out
 
   def apply_op(op, arr):
-    if op in BIN_OPS or op in UN_OPS or op == "clamp" or op == "dnor":
-      tmp_src = " ".join([fmt_num(v) for v in arr] + [op])
-      sub = evaluate_rpn(tmp_src, vars_state=vars_state[:], params={}, simvars=json.loads(json.dumps(simvars)), functions=functions, results_history=[])
-      return sub["stack"][-1] if sub["stack"] else 0.0
+    # operator straight on the numbers via its VM handler (no tokenize/compile/VM setup per step)
+    opc = STACK_OPCODES.get(op)
+    if opc is not None:
+      st = [float(v) for v in arr]
+      HANDLERS[opc - OP_FIRST_STACK](st)
+      return st[-1] if st else 0.0
     raise RuntimeError("Unsupported op in step: "+op)
 
   toks = list(tokens)
   print(" ".join(toks))
   step = 1
+  # tokens left of the last replaced range are unchanged and held no reducible op,
+  # so each step resumes scanning there with the value segments already collected
+  resume = 0
+  seg = []
   while True:
-    seg = []
+    # block ends of the current token list, once per step instead of a scan per if{/else{
+    ends = block_ends(toks, resume)
+    def find_end(i):
+      if i not in ends: raise RuntimeError("Fehlende schließende '}' ab Index %d" % i)
+      return ends[i]
     highlight_a = -1; highlight_b = -1; op_idx = -1; args = []; num_args = []; chosen = None
-    for i,t in enumerate(toks):
-      if token_is_value(t):
-        seg.append({"start":i,"end":i,"val":token_value(t),"text":t})
+    for i in range(resume, len(toks)):
+      t = toks[i]
+      v = token_value(t)
+      if v is not None:
+        seg.append({"start":i,"end":i,"val":v,"text":t})
         continue
       if t == "if{":
         if len(seg) < 1: continue
-        end_if = find_block_end(toks, i)
+        end_if = find_end(i)
         has_else = (end_if + 1 < len(toks) and toks[end_if+1] == "else{")
         if has_else:
-          end_else = find_block_end(toks, end_if+1)
+          end_else = find_end(end_if+1)
           args = seg[-1:]
           num_args = [args[0]["val"]]
           highlight_a = args[0]["start"]; highlight_b = end_else
@@ -491,9 +798,8 @@ def step_verbose(tokens, *, vars_state, regs, simvars, functions, no_color=False
           num_args = [args[0]["val"]]
           highlight_a = args[0]["start"]; highlight_b = end_if
           op_idx = i; chosen = t; break
-      f_map = {f["name"]: f for f in functions}
-      if t in f_map:
-        k = f_map[t]["params"]
+      if t in func_map:
+        k = func_map[t]["params"]
         if len(seg) >= k:
           args = seg[-k:]
           num_args = [a["val"] for a in args]
@@ -501,7 +807,7 @@ def step_verbose(tokens, *, vars_state, regs, simvars, functions, no_color=False
           op_idx = i; chosen = t; break
         else:
           continue
-      k = 1 if t in UN_OPS else (2 if t in BIN_OPS else (3 if t=="clamp" else 0))
+      k = OP_ARITY.get(t, 0)
       if k and len(seg) >= k:
         args = seg[-k:]
         num_args = [a["val"] for a in args]
@@ -509,20 +815,23 @@ def step_verbose(tokens, *, vars_state, regs, simvars, functions, no_color=False
         op_idx = i; chosen = t; break
 
     if highlight_a == -1: break
+    resume = highlight_a
+    seg = seg[:len(seg) - len(args)]
 
     style_mid = "M" if marker else "Y"
     print(f"Schritt {step}: {highlight_range(toks, highlight_a, highlight_b, style_mid)}")
 
     if chosen == "if{":
-      end_if = find_block_end(toks, op_idx)
+      end_if = find_end(op_idx)
       has_else = (end_if + 1 < len(toks) and toks[end_if+1] == "else{")
       if has_else:
-        end_else = find_block_end(toks, end_if+1)
+        end_else = find_end(end_if+1)
       cond = num_args[0]
       take_if = (cond != 0)
       if_body = toks[op_idx+1:end_if]
       else_body = toks[end_if+2:end_else] if has_else else []
-      sub = evaluate_rpn(" ".join(if_body if take_if else else_body), vars_state=vars_state[:], params={}, simvars=json.loads(json.dumps(simvars)), functions=functions, results_history=[])
+      body = if_body if take_if else else_body
+      sub = evaluate_rpn_tokens(body, vars_state=vars_state[:], params={}, simvars=sim_for(body), functions=functions, results_history=[])
       out_vals = [fmt_num(v) for v in sub["stack"]]
       which = "IF" if take_if else ("ELSE" if has_else else "NONE")
       vis_if = "..." if not take_if else " ".join(if_body)
@@ -531,8 +840,7 @@ def step_verbose(tokens, *, vars_state, regs, simvars, functions, no_color=False
       if has_else: preview += f" else{{ {vis_else} }}"
       preview += f" → Zweig: {which} → {' '.join(out_vals) if out_vals else ''}"
       print(ANSI["yellow"] + preview + ANSI["reset"])
-      new_toks = toks[:highlight_a] + out_vals + toks[highlight_b+1:]
-      toks = new_toks
+      toks[highlight_a:highlight_b+1] = out_vals
       if endstep:
         if out_vals:
           idx = highlight_a + max(len(out_vals)-1,0)
@@ -541,30 +849,25 @@ def step_verbose(tokens, *, vars_state, regs, simvars, functions, no_color=False
         else:
           print(f"Schritt {step} Ende: {' '.join(toks)}")
     else:
-      f_map = {f["name"]: f for f in functions}
-      if chosen in f_map:
-        f = f_map[chosen]
+      if chosen in func_map:
+        f = func_map[chosen]
         sub_toks = []
         for tok in tokenize(f["rpn"]):
-          m = re.fullmatch(r"p(\d+)", tok)
-          if m:
-            pi = int(m.group(1))
+          if is_param_token(tok):
+            pi = int(tok[1:])
             sub_toks.append(fmt_num(num_args[pi-1] if 1<=pi<=len(num_args) else 0))
           else:
             sub_toks.append(tok)
-        sub = evaluate_rpn(" ".join(sub_toks), vars_state=vars_state[:], params={}, simvars=json.loads(json.dumps(simvars)), functions=functions, results_history=[])
+        sub = evaluate_rpn_tokens(sub_toks, vars_state=vars_state[:], params={}, simvars=sim_for(sub_toks), functions=functions, results_history=[])
         res = sub["stack"][-1] if sub["stack"] else 0.0
         left_txt = " ".join([a["text"] for a in args])
         print(ANSI["yellow"] + f"{left_txt} {chosen} = {fmt_num(res)}" + ANSI["reset"])
-        new_toks = toks[:highlight_a] + [fmt_num(res)] + toks[op_idx+1:]
-        toks = new_toks
+        toks[highlight_a:op_idx+1] = [fmt_num(res)]
         if endstep:
           style = "M" if marker else "Y"
           print(f"Schritt {step} Ende: {highlight_single(toks, highlight_a, style)}")
       else:
-        tmp_src = " ".join([fmt_num(v) for v in num_args] + [chosen])
-        sub = evaluate_rpn(tmp_src, vars_state=vars_state[:], params={}, simvars=json.loads(json.dumps(simvars)), functions=functions, results_history=[])
-        res = sub["stack"][-1] if sub["stack"] else 0.0
+        res = apply_op(chosen, num_args)
         if infix and len(num_args)==2:
           print(ANSI["yellow"] + f"{args[0]['text']} {chosen} {args[1]['text']} = {fmt_num(res)}" + ANSI["reset"])
         elif infix and len(num_args)==1:
@@ -572,8 +875,7 @@ def step_verbose(tokens, *, vars_state, regs, simvars, functions, no_color=False
         else:
           left_txt = " ".join([a["text"] for a in args])
           print(ANSI["yellow"] + f"{left_txt} {chosen} = {fmt_num(res)}" + ANSI["reset"])
-        new_toks = toks[:highlight_a] + [fmt_num(res)] + toks[op_idx+1:]
-        toks = new_toks
+        toks[highlight_a:op_idx+1] = [fmt_num(res)]
         if endstep:
           style = "M" if marker else "Y"
           print(f"Schritt {step} Ende: {highlight_single(toks, highlight_a, style)}")
@@ -583,8 +885,14 @@ def step_verbose(tokens, *, vars_state, regs, simvars, functions, no_color=False
   print(" ".join(toks))
 
 # ----------- CLI / REPL -----------
+_CLS = b"\x1b[2J\x1b[H"
+
 def clear_screen():
-  os.system("cls" if os.name == "nt" else "clear")
+  # ANSI clear + home instead of spawning a shell; piped output stays clean
+  if os.name == "nt":
+    os.system("cls")
+  elif sys.stdout.isatty():
+    sys.stdout.flush(); sys.stdout.buffer.write(_CLS); sys.stdout.buffer.flush()
 
 def print_usage():
   print(f"""Usage:
@@ -599,7 +907,7 @@ Options:
   --nocolor, -c/-n   Farben aus
   --mark, -m         Markieren mit gelbem Hintergrund
   --noprompt         Unterdrückt Param-Prompt-Labels (Eingabe bleibt erforderlich)
-  --ctx JSON         Inline-Kontext (params, simvars)
+  --ctx JSON|DATEI   Inline-Kontext (params, simvars) oder Pfad zu einer JSON-Datei
   --print            Persistente Variablen ausgeben (ohne <expr>)
   --reset            Persistente Variablen zurücksetzen (ohne <expr>)
   --help, -?         Hilfe
@@ -627,6 +935,48 @@ last_postfix = ""
 
 # readline
 _readline = None
+
+# TAB completion: static words sorted once, functions/SimVars merged in when their files change
+_COMPLETE_COMMANDS = sorted({":e",":fe",":s",":l",":r",":rl",":f",":?",
+                             ":step",":p",":color",":mark",":end",":infix",
+                             ":si",":sp",":spi",":sip",":i",":ip",":noprompt",":q",":="})
+_STATIC_POOL = {"+","-","*","/","%","^","and","or","not","&&","||","!",
+                ">","<",">=","<=","==","=","!=","<>",
+                "round","floor","ceil","abs","sin","cos","tan","log","exp",
+                "min","max","clamp","pow2","pow","sqrt2","sqrt","dnor",
+                "if{","else{","}"}
+for _i in range(10): _STATIC_POOL |= {f"s{_i}", f"l{_i}", f"sp{_i}", f"lp{_i}"}
+_STATIC_POOL |= {f"p{_i}" for _i in range(1,10)} | {f"r{_i}" for _i in range(1,9)}
+_pool_cache = {"stamp": None, "pool": sorted(_STATIC_POOL)}
+_complete_last = {"buffer": None, "cand": []}
+
+def completion_pool():
+  stamp = (_file_stamp(FUNC_PATH), _file_stamp(SIM_PATH))
+  if stamp == _pool_cache["stamp"]:
+    return _pool_cache["pool"]
+  funcs = [f["name"] for f in load_funcs()]
+  sim = load_json(SIM_PATH, {"simvars": {}}).get("simvars", {})
+  sv = set()
+  prefixes = {k for k,v in sim.items() if isinstance(v, dict)}
+  prefixes.add("A")
+  for pref in prefixes:
+    sv.add(f"({pref}:"); sv.add(f"(>{pref}:")
+    for key in sim.get(pref, {}):
+      sv.add(f"({pref}:{key})"); sv.add(f"(>{pref}:{key})")
+  for k,v in sim.items():
+    if not isinstance(v, dict):
+      sv.add(f"(A:{k})"); sv.add(f"(>A:{k})")
+  _pool_cache["stamp"] = stamp
+  _pool_cache["pool"] = sorted(_STATIC_POOL | set(funcs) | sv)
+  return _pool_cache["pool"]
+
+def _prefix_range(words, prefix):
+  # words is sorted: all matches form one contiguous slice
+  lo = bisect.bisect_left(words, prefix)
+  hi = lo
+  while hi < len(words) and words[hi].startswith(prefix): hi += 1
+  return words[lo:hi]
+
 def setup_readline():
   global _readline
   try:
@@ -637,43 +987,18 @@ def setup_readline():
     except Exception:
       _readline = None
   if _readline:
-    try:
-      _readline.read_history_file(str(HIST_PATH))
-    except Exception:
-      pass
+    open_history()
     def completer(text, state):
-      buffer = _readline.get_line_buffer()
-      commands = [":e",":fe",":s",":l",":r",":rl",":f",":?",
-                  ":step",":p",":color",":mark",":end",":infix",
-                  ":si",":sp",":spi",":sip",":i",":ip",":noprompt",":q",":="]
-      ops = ["+","-","*","/","%","^","and","or","not","&&","||","!",
-             ">","<",">=","<=","==","=","!=","<>",
-             "round","floor","ceil","abs","sin","cos","tan","log","exp",
-             "min","max","clamp","pow2","pow","sqrt2","sqrt","dnor",
-             "if{","else{","}"]
-      regs = []
-      for i in range(10): regs += [f"s{i}",f"l{i}",f"sp{i}",f"lp{i}"]
-      regs += [f"p{i}" for i in range(1,10)] + [f"r{i}" for i in range(1,9)]
-      funcs = [f["name"] for f in load_funcs()]
-      sim = load_json(SIM_PATH, {"simvars": {}}).get("simvars", {})
-      sv = set()
-      prefixes = {k for k,v in sim.items() if isinstance(v, dict)}
-      prefixes.add("A")
-      for pref in prefixes:
-        sv.add(f"({pref}:"); sv.add(f"(>{pref}:")
-        for key in sim.get(pref, {}):
-          sv.add(f"({pref}:{key})"); sv.add(f"(>{pref}:{key})")
-      for k,v in sim.items():
-        if not isinstance(v, dict):
-          sv.add(f"(A:{k})"); sv.add(f"(>A:{k})")
-      pool = set(ops) | set(regs) | set(funcs) | sv
-      if buffer.strip().startswith(":"):
-        cand = [c for c in commands if c.startswith(buffer.strip())]
-      else:
-        parts = buffer.split()
-        prefix = parts[-1] if parts else ""
-        cand = [c for c in pool if c.startswith(prefix)]
-      cand = sorted(set(cand))
+      # readline calls this for state=0..N; the candidate list is built on state 0 only
+      if state == 0 or _complete_last["buffer"] is None:
+        buffer = _readline.get_line_buffer()
+        _complete_last["buffer"] = buffer
+        if buffer.strip().startswith(":"):
+          _complete_last["cand"] = _prefix_range(_COMPLETE_COMMANDS, buffer.strip())
+        else:
+          parts = buffer.split()
+          _complete_last["cand"] = _prefix_range(completion_pool(), parts[-1] if parts else "")
+      cand = _complete_last["cand"]
       if state < len(cand): return cand[state]
       return None
     try:
@@ -687,48 +1012,77 @@ def setup_readline():
       _readline.set_completer(completer)
     except Exception:
       pass
-    atexit.register(save_history_truncated)
+    atexit.register(close_history)
 
-def save_history_truncated():
-  if not _readline: return
+# history file is appended line by line; rewritten (truncated) at exit only when longer than HIST_MAX
+_hist_file = None
+_hist_lines = 0
+
+def open_history():
+  global _hist_file, _hist_lines
   try:
-    n = _readline.get_current_history_length()
-    start = max(1, n - HIST_MAX + 1)
-    lines = []
-    for i in range(start, n+1):
-      it = _readline.get_history_item(i)
-      if it is not None: lines.append(it)
-    HIST_PATH.write_text("\n".join(lines) + ("\n" if lines else ""), encoding="utf-8")
+    _readline.read_history_file(str(HIST_PATH))
   except Exception:
     pass
+  _hist_lines = _readline.get_current_history_length()
+  try:
+    _hist_file = open(HIST_PATH, "a", encoding="utf-8", buffering=1)
+  except OSError:
+    _hist_file = None
+
+def remember_history(line):
+  global _hist_lines
+  if _hist_file is None: return
+  try:
+    _hist_file.write(line + "\n")
+    _hist_lines += 1
+  except OSError:
+    pass
+
+def close_history():
+  global _hist_file
+  if _hist_file is not None:
+    try: _hist_file.close()
+    except OSError: pass
+    _hist_file = None
+  if _hist_lines > HIST_MAX:
+    try:
+      lines = HIST_PATH.read_text(encoding="utf-8").splitlines()[-HIST_MAX:]
+      HIST_PATH.write_text("\n".join(lines) + ("\n" if lines else ""), encoding="utf-8")
+    except Exception:
+      pass
+
+_HELP = (
+  "RPN-REPL Befehle:\n"
+  "  :e        - ~/.simvars.json bearbeiten\n"
+  "  :fe       - ~/.rpnfunc.json bearbeiten\n"
+  "  :s        - SimVars anzeigen\n"
+  "  :l        - Persistente Variablen anzeigen\n"
+  "  :r        - Persistente Variablen zurücksetzen\n"
+  "  :rl       - Result-Stacks (r1..r8) anzeigen\n"
+  "  :f        - Funktionen auflisten\n"
+  "  :?        - Letzten Postfix anzeigen\n"
+  "  := <INFIX>- (kein Parser hier) wird direkt evaluiert wie eingegeben\n"
+  "  :step     - Step-Modus umschalten\n"
+  "  :p        - Precompile umschalten\n"
+  "  :color    - No-Color umschalten\n"
+  "  :mark     - Marker umschalten\n"
+  "  :end      - Endstep umschalten (impliziert Step)\n"
+  "  :infix    - Infix-Ausgabe im Step-Modus umschalten\n"
+  "  :si       - Step+Infix EIN (wenn AUS) / Step AUS (wenn AN)\n"
+  "  :sp       - Step+Precompile EIN (wenn AUS) / Step AUS (wenn AN)\n"
+  "  :spi/:sip - Step+Precompile+Infix EIN (wenn AUS) / Step AUS (wenn AN)\n"
+  "  :i        - Eingabe-Modus (tokenweise) umschalten\n"
+  "  :ip       - Im Eingabe-Modus Postfix-Puffer über jeder Eingabe anzeigen umschalten\n"
+  "  :noprompt - Parametereingabe ohne Labels (nur REPL) umschalten\n"
+  "  :q        - Beenden\n"
+  "\n"
+  "Eingaben ohne ':' werden als Postfix direkt ausgewertet. Leere Eingabe zeigt diese Hilfe.\n"
+)
 
 def print_help():
   clear_screen()
-  print("RPN-REPL Befehle:")
-  print("  :e        - ~/.simvars.json bearbeiten")
-  print("  :fe       - ~/.rpnfunc.json bearbeiten")
-  print("  :s        - SimVars anzeigen")
-  print("  :l        - Persistente Variablen anzeigen")
-  print("  :r        - Persistente Variablen zurücksetzen")
-  print("  :rl       - Result-Stacks (r1..r8) anzeigen")
-  print("  :f        - Funktionen auflisten")
-  print("  :?        - Letzten Postfix anzeigen")
-  print("  := <INFIX>- (kein Parser hier) wird direkt evaluiert wie eingegeben")
-  print("  :step     - Step-Modus umschalten")
-  print("  :p        - Precompile umschalten")
-  print("  :color    - No-Color umschalten")
-  print("  :mark     - Marker umschalten")
-  print("  :end      - Endstep umschalten (impliziert Step)")
-  print("  :infix    - Infix-Ausgabe im Step-Modus umschalten")
-  print("  :si       - Step+Infix EIN (wenn AUS) / Step AUS (wenn AN)")
-  print("  :sp       - Step+Precompile EIN (wenn AUS) / Step AUS (wenn AN)")
-  print("  :spi/:sip - Step+Precompile+Infix EIN (wenn AUS) / Step AUS (wenn AN)")
-  print("  :i        - Eingabe-Modus (tokenweise) umschalten")
-  print("  :ip       - Im Eingabe-Modus Postfix-Puffer über jeder Eingabe anzeigen umschalten")
-  print("  :noprompt - Parametereingabe ohne Labels (nur REPL) umschalten")
-  print("  :q        - Beenden")
-  print("")
-  print("Eingaben ohne ':' werden als Postfix direkt ausgewertet. Leere Eingabe zeigt diese Hilfe.")
+  sys.stdout.write(_HELP); sys.stdout.flush()
 
 def call_calc(expr=None, admin=None):
   global step_mode, precompile_mode, no_color, marker, endstep_mode, infix_mode, repl_param_silent
@@ -750,21 +1104,22 @@ def call_calc(expr=None, admin=None):
   params = {}
 
   try:
-    eval_expr = expr or ""
-    missing = collect_missing_params(tokenize(eval_expr), params)
+    toks = tokenize(expr or "")
+    missing = collect_missing_params(toks, params)
     if missing:
       params.update(prompt_params(missing, silent=repl_param_silent))
 
     if precompile_mode:
-      eval_expr = " ".join(precompile_tokens(tokenize(eval_expr), functions))
+      toks = precompile_tokens(toks, functions)
 
-    result = evaluate_rpn(eval_expr, vars_state=vars_state, params=params, simvars=simvars, functions=functions, results_history=results)
+    result = evaluate_rpn_tokens(toks, vars_state=vars_state, params=params, simvars=simvars, functions=functions, results_history=results)
 
-    save_state_vars(result["vars"])
+    if result["vars_dirty"]:
+      save_state_vars(result["vars"])
     if result["sim_dirty"]:
       save_simvars(result["simvars"])
 
-    if not is_pure_r_token_expression(eval_expr):
+    if not is_pure_r_tokens(toks):
       new_hist = [list(result["stack"])] + results
       save_results(new_hist[:8])
 
@@ -780,10 +1135,67 @@ def call_calc(expr=None, admin=None):
     print("Error:", e)
     return 1
 
+def _toggle(name, label=None):
+  def handler():
+    g = globals(); g[name] = not g[name]
+    if label: print(f"{label}: {'AN' if g[name] else 'AUS'}")
+  return handler
+
+def _step_with(*names):
+  # :si/:sp/:spi - step on together with the given modes, or step off
+  labels = {"infix_mode": "Infix", "precompile_mode": "Precompile"}
+  on_msg = ", ".join(["Step: AN"] + [f"{labels[n]}: AN" for n in names])
+  def handler():
+    global step_mode
+    if not step_mode:
+      step_mode = True
+      for n in names: globals()[n] = True
+      print(on_msg)
+    else:
+      step_mode = False; print("Step: AUS")
+  return handler
+
+def _cmd_funcs():
+  arr = load_funcs()
+  if not arr: print("(keine Funktionen)")
+  sys.stdout.write("".join(f"- {f['name']}({f['params']}): {f['rpn']}\n" for f in arr))
+
+def _cmd_input_mode():
+  global input_mode, input_buffer
+  input_mode = not input_mode; input_buffer = []
+  print(f"Eingabe-Modus (tokenweise): {'AN' if input_mode else 'AUS'}")
+
+# ":cmd" -> handler, one dict probe instead of an if/elif ladder (":q" and ":= <INFIX>" stay in repl())
+REPL_COMMANDS = {
+  ":e": lambda: subprocess.run([*EDITOR_CMD, str(SIM_PATH)]),
+  ":fe": lambda: subprocess.run([*EDITOR_CMD, str(FUNC_PATH)]),
+  ":s": lambda: print(json.dumps({"simvars": load_simvars()}, indent=2, ensure_ascii=False)),
+  ":l": lambda: call_calc(admin="--print"),
+  ":r": lambda: call_calc(admin="--reset"),
+  ":rl": lambda: print(json.dumps(load_json(STACK_PATH, {"results":[]}), indent=2, ensure_ascii=False)),
+  ":f": _cmd_funcs,
+  ":?": lambda: print(last_postfix or "(kein letzter Postfix)"),
+  ":step": _toggle("step_mode", "Step-Modus"),
+  ":p": _toggle("precompile_mode", "Precompile"),
+  ":color": _toggle("no_color", "No-Color"),
+  ":mark": _toggle("marker", "Marker"),
+  ":end": _toggle("endstep_mode"),
+  ":infix": _toggle("infix_mode", "Infix"),
+  ":si": _step_with("infix_mode"),
+  ":sp": _step_with("precompile_mode"),
+  ":spi": _step_with("precompile_mode", "infix_mode"),
+  ":sip": _step_with("precompile_mode", "infix_mode"),
+  ":i": _cmd_input_mode,
+  ":ip": _toggle("input_prompt", "Input-Prompt-Anzeige"),
+  ":noprompt": _toggle("repl_param_silent", "REPL Param-Prompts ohne Label"),
+}
+
 def repl():
-  global step_mode, precompile_mode, no_color, marker, endstep_mode, infix_mode
-  global input_mode, input_prompt, input_buffer, last_postfix, repl_param_silent
+  global input_buffer, last_postfix
 
+  # only an interactive REPL needs readline/history; one-shot CLI runs and piped scripts never import it
+  if sys.stdin.isatty():
+    setup_readline()
   print_help()
   while True:
     try:
@@ -794,6 +1206,7 @@ def repl():
       break
     if line is None: line = ""
     line = line.rstrip("\n")
+    if line.strip(): remember_history(line)
     if input_mode:
       if line.strip()=="" or line.strip()=="=":
         if input_buffer:
@@ -814,41 +1227,12 @@ def repl():
     if line.startswith(":"):
       cmd = line.strip()
       if cmd == ":q": break
-      elif cmd == ":e": subprocess.run([os.environ.get("EDITOR","vim"), str(SIM_PATH)])
-      elif cmd == ":fe": subprocess.run([os.environ.get("EDITOR","vim"), str(FUNC_PATH)])
-      elif cmd == ":s": print(json.dumps({"simvars": load_simvars()}, indent=2, ensure_ascii=False))
-      elif cmd == ":l": call_calc(admin="--print")
-      elif cmd == ":r": call_calc(admin="--reset")
-      elif cmd == ":rl": print(json.dumps(load_json(STACK_PATH, {"results":[]}), indent=2, ensure_ascii=False))
-      elif cmd == ":f": 
-        arr = load_funcs()
-        if not arr: print("(keine Funktionen)")
-        for f in arr: print(f"- {f['name']}({f['params']}): {f['rpn']}")
-      elif cmd == ":?": print(last_postfix or "(kein letzter Postfix)")
-      elif cmd.startswith(":="):
-        expr = cmd[2:].strip(); 
+      if cmd.startswith(":="):
+        expr = cmd[2:].strip()
         if not expr: print("Verwendung: := <INFIX-AUSDRUCK>")
         else: last_postfix = expr; call_calc(expr)
-      elif cmd == ":step": step_mode = not step_mode; print(f"Step-Modus: {'AN' if step_mode else 'AUS'}")
-      elif cmd == ":p": precompile_mode = not precompile_mode; print(f"Precompile: {'AN' if precompile_mode else 'AUS'}")
-      elif cmd == ":color": no_color = not no_color; print(f"No-Color: {'AN' if no_color else 'AUS'}")
-      elif cmd == ":mark": marker = not marker; print(f"Marker: {'AN' if marker else 'AUS'}")
-      elif cmd == ":end": endstep_mode = not endstep_mode; 
-      elif cmd == ":infix": infix_mode = not infix_mode; print(f"Infix: {'AN' if infix_mode else 'AUS'}")
-      elif cmd == ":si":
-        if not step_mode: step_mode=True; infix_mode=True; print("Step: AN, Infix: AN")
-        else: step_mode=False; print("Step: AUS")
-      elif cmd == ":sp":
-        if not step_mode: step_mode=True; precompile_mode=True; print("Step: AN, Precompile: AN")
-        else: step_mode=False; print("Step: AUS")
-      elif cmd in (":spi",":sip"):
-        if not step_mode: step_mode=True; precompile_mode=True; infix_mode=True; print("Step: AN, Precompile: AN, Infix: AN")
-        else: step_mode=False; print("Step: AUS")
-      elif cmd == ":i": input_mode = not input_mode; input_buffer=[]; print(f"Eingabe-Modus (tokenweise): {'AN' if input_mode else 'AUS'}")
-      elif cmd == ":ip": input_prompt = not input_prompt; print(f"Input-Prompt-Anzeige: {'AN' if input_prompt else 'AUS'}")
-      elif cmd == ":noprompt": repl_param_silent = not repl_param_silent; print(f"REPL Param-Prompts ohne Label: {'AN' if repl_param_silent else 'AUS'}")
       else:
-        print_help()
+        REPL_COMMANDS.get(cmd, print_help)()
       continue
 
     last_postfix = line.strip()
@@ -857,27 +1241,27 @@ def repl():
 def main():
   args = sys.argv[1:]
   if not args:
-    setup_readline()
-    atexit.register(save_history_truncated)
+    defer_json_writes()
     repl()
     return
 
-  do_help = ("--help" in args) or ("-?" in args)
-  do_step = ("--step" in args) or ("-s" in args)
-  do_pre = ("--precompile" in args) or ("-p" in args)
-  no_prompt = ("--noprompt" in args)
-  no_col = ("--nocolor" in args) or ("-c" in args) or ("-n" in args)
-  mark = ("--mark" in args) or ("-m" in args)
-  endstep = ("--endstep" in args)
-  infix = ("--infix" in args) or ("-i" in args)
-
-  if "--reset" in args:
+  flags = set(args)   # one hash probe per flag check instead of an argv scan each
+  do_help = ("--help" in flags) or ("-?" in flags)
+  do_step = ("--step" in flags) or ("-s" in flags)
+  do_pre = ("--precompile" in flags) or ("-p" in flags)
+  no_prompt = ("--noprompt" in flags)
+  no_col = ("--nocolor" in flags) or ("-c" in flags) or ("-n" in flags)
+  mark = ("--mark" in flags) or ("-m" in flags)
+  endstep = ("--endstep" in flags)
+  infix = ("--infix" in flags) or ("-i" in flags)
+
+  if "--reset" in flags:
     save_state_vars([0]*10)
     print("Variablen s0..s9 zurückgesetzt.")
     print("State-Datei:", STATE_PATH)
     return
 
-  if "--print" in args:
+  if "--print" in flags:
     print("Persistente Variablen (s0..s9):", load_state_vars())
     print("State-Datei:", STATE_PATH)
     return
@@ -890,11 +1274,18 @@ def main():
     if not has_expr: return
 
   inline_ctx = {}
-  if "--ctx" in args:
+  if "--ctx" in flags:
     i = args.index("--ctx")
     if i+1 < len(args):
+      raw = args[i+1]
+      if not raw.lstrip().startswith("{"):
+        # a file path: big contexts need not be copied through argv
+        try: raw = Path(raw).read_text(encoding="utf-8")
+        except OSError as e:
+          print("Error: --ctx Datei nicht lesbar:", e)
+          return
       try:
-        inline_ctx = json.loads(args[i+1])
+        inline_ctx = json.loads(raw)
       except Exception as e:
         print("Error: --ctx ist kein gültiges JSON:", e)
         return
@@ -906,26 +1297,26 @@ def main():
 
   params = inline_ctx.get("params", {})
   ctx_sim = inline_ctx.get("simvars", {})
-  merged_sim = json.loads(json.dumps(simvars))
+  merged_sim = simvars   # load_simvars() already hands out fresh per-prefix dicts
   for pref, data in ctx_sim.items():
     if isinstance(data, dict):
       merged_sim.setdefault(pref, {}).update(data)
 
   try:
-    ev_expr = expr
+    toks = tokenize(expr)
     # prompt for missing pN first (labels unless --noprompt given)
-    missing_cli = collect_missing_params(tokenize(ev_expr), params)
+    missing_cli = collect_missing_params(toks, params)
     if missing_cli:
       params.update(prompt_params(missing_cli, silent=no_prompt))
-    if do_pre:
-      ev_expr = " ".join(precompile_tokens(tokenize(ev_expr), functions))
-    result = evaluate_rpn(ev_expr, vars_state=vars_state, params=params, simvars=merged_sim, functions=functions, results_history=results)
+    ev_toks = precompile_tokens(toks, functions) if do_pre else toks
+    result = evaluate_rpn_tokens(ev_toks, vars_state=vars_state, params=params, simvars=merged_sim, functions=functions, results_history=results)
 
-    save_state_vars(result["vars"])
+    if result["vars_dirty"]:
+      save_state_vars(result["vars"])
     if result["sim_dirty"]:
       save_simvars(result["simvars"])
 
-    if not is_pure_r_token_expression(expr):
+    if not is_pure_r_tokens(toks):
       save_results([list(result["stack"])] + results)
 
     if do_step or endstep:
@@ -10,25 +10,42 @@ import os
 import sys
 import json
 import shlex
+import shutil
 import subprocess
+import bisect
 from pathlib import Path
 
+try:
+    import orjson  # optional: much faster parsing of large SimVars/function files
+except ImportError:
+    orjson = None
+
 # ----- readline / history (arrow keys + completion) -----
+# piped input (scripts) skips readline entirely: no history load/save, no completer
 _rl = None
-try:
-    import readline as _rl  # Linux/macOS
-except Exception:
+if sys.stdin.isatty():
     try:
-        import pyreadline3 as _rl  # Windows
+        import readline as _rl  # Linux/macOS
     except Exception:
-        _rl = None
+        try:
+            import pyreadline3 as _rl  # Windows
+        except Exception:
+            _rl = None
 
 HISTFILE = Path.home() / ".rpn_repl_history"
 HIST_MAX = 100
+HIST_FLUSH_EVERY = 50   # history file is also written every N commands, not only at exit
+
+_manual_history = False  # True if readline auto-history is off and we add entries ourselves
+_last_added = None
+_since_flush = 0
 
 def _load_history():
     if not _rl:
         return
+    # readline caps the file at HIST_MAX entries itself when writing it
+    if hasattr(_rl, "set_history_length"):
+        _rl.set_history_length(HIST_MAX)
     try:
         _rl.read_history_file(str(HISTFILE))
     except FileNotFoundError:
@@ -40,30 +57,35 @@ def _save_history_truncated():
     if not _rl:
         return
     try:
-        # extract last HIST_MAX entries
-        n = _rl.get_current_history_length()
-        start = max(1, n - HIST_MAX + 1)
-        lines = []
-        for i in range(start, n + 1):
-            item = _rl.get_history_item(i)
-            if item is not None:
-                lines.append(item)
-        # write manually
-        with open(HISTFILE, "w", encoding="utf-8") as f:
-            for line in lines:
-                f.write(line + "\n")
+        _rl.write_history_file(str(HISTFILE))
     except Exception:
         # fallback: don't crash on history save
         pass
 
+def _remember(line):
+    """Add line to history (skipping a repeat of the previous entry), flush periodically."""
+    global _last_added, _since_flush
+    if not _rl:
+        return
+    if _manual_history and line.strip() and line != _last_added:
+        _rl.add_history(line)
+        _last_added = line
+    _since_flush += 1
+    if _since_flush >= HIST_FLUSH_EVERY:
+        _since_flush = 0
+        _save_history_truncated()
+
 HOME = Path.home()
 RPN_JS = os.environ.get("RPN_JS", "rpn.js")
+NODE_BIN = shutil.which("node") or "node"   # PATH lookup once, not per (re)start of the server
 STATE_PATH = os.environ.get("RPN_STATE", str(HOME / ".rpn_state.json"))
 SIM_PATH   = os.environ.get("RPN_SIMVARS", str(HOME / ".simvars.json"))
 FUNC_PATH  = os.environ.get("RPN_FUNCS", str(HOME / ".rpnfunc.json"))
 STACK_PATH = os.environ.get("RPN_STACK", str(HOME / ".rpnstack.json"))
 
 EDITOR = os.environ.get("EDITOR", "vim")
+# only split when $EDITOR is not itself a program (e.g. "code -w"); Windows paths keep their spaces/quotes
+EDITOR_CMD = [EDITOR] if os.name == "nt" or shutil.which(EDITOR) else (shlex.split(EDITOR) or ["vim"])
 
 # session toggles
 step_mode = False
@@ -81,17 +103,59 @@ input_buffer = []
 last_postfix = ""
 
 # ----- helpers -----
+_CLS = b"\x1b[2J\x1b[H"
+
 def clear_screen():
-    os.system('cls' if os.name == 'nt' else 'clear')
+    # ANSI clear + home instead of spawning a shell; piped output stays clean
+    if os.name == 'nt':
+        os.system('cls')
+    elif sys.stdout.isatty():
+        sys.stdout.flush()
+        sys.stdout.buffer.write(_CLS)
+        sys.stdout.buffer.flush()
+
+_json_cache = {}   # path -> ((ino, mtime_ns, size), parsed); callers must not mutate the result
+
+def _parse_json(raw):
+    if orjson is not None:
+        try:
+            return orjson.loads(raw)
+        except orjson.JSONDecodeError:
+            pass  # e.g. NaN/Infinity written by json.dump
+    return json.loads(raw)
 
 def read_json(path, default):
+    """Parsed JSON, re-read only when the file stamp changed (completer and :s/:f hit this)."""
     try:
-        with open(path, "r", encoding="utf-8") as f:
-            return json.load(f)
+        st = os.stat(path)
+        # st_ino: rpn.js saves via tmp file + rename, so a rewrite in the same mtime tick still shows
+        key = (st.st_ino, st.st_mtime_ns, st.st_size)
+        hit = _json_cache.get(path)
+        if hit and hit[0] == key:
+            return hit[1]
+        with open(path, "rb") as f:
+            data = _parse_json(f.read())
+        _json_cache[path] = (key, data)
+        return data
     except Exception:
         return default
 
 def list_simvars():
+    # rpn.js writes this file pretty-printed already: show it as is instead of re-dumping;
+    # the (stamp-cached) read_json only checks that it parses, invalid/missing -> empty default
+    text = None
+    if read_json(SIM_PATH, _NO_SIMVARS) is not _NO_SIMVARS:
+        try:
+            with open(SIM_PATH, "r", encoding="utf-8") as f:
+                text = f.read()
+        except OSError:
+            pass
+    if text is None:
+        text = json.dumps(_NO_SIMVARS, indent=2)
+    sys.stdout.write(text if text.endswith("\n") else text + "\n")
+
+def list_simvars_pretty():
+    # parse + re-dump: normalized layout for a hand-edited file
     data = read_json(SIM_PATH, {"simvars": {}})
     print(json.dumps(data, indent=2, ensure_ascii=False))
 
@@ -100,11 +164,8 @@ def list_functions():
     if not arr:
         print("(keine Funktionen definiert)")
         return
-    for f in arr:
-        name = f.get("name")
-        params = f.get("params")
-        rpn = f.get("rpn")
-        print(f"- {name}({params}): {rpn}")
+    # one write for the whole listing instead of a print() per entry
+    sys.stdout.write("".join(f"- {f.get('name')}({f.get('params')}): {f.get('rpn')}\n" for f in arr))
 
 def list_results():
     data = read_json(STACK_PATH, {"results": []})
@@ -112,40 +173,45 @@ def list_results():
     if not results:
         print("(keine gespeicherten Result-Stacks)")
         return
-    for i, st in enumerate(results, start=1):
-        print(f"r{i}: {st}")
+    sys.stdout.write("".join(f"r{i}: {st}\n" for i, st in enumerate(results, start=1)))
+
+_HELP = (
+    "RPN-REPL Befehle:\n"
+    "  :e        - ~/.simvars.json mit $EDITOR bearbeiten\n"
+    "  :fe       - ~/.rpnfunc.json mit $EDITOR bearbeiten\n"
+    "  :s        - SimVars anzeigen (aus Datei)\n"
+    "  :sj       - SimVars neu formatiert anzeigen (geparst, z. B. nach Handbearbeitung)\n"
+    "  :l        - Persistente Variablen anzeigen (ruft rpn.js --print)\n"
+    "  :r        - Persistente Variablen resetten (ruft rpn.js --reset)\n"
+    "  :rl       - Result-Stacks (r1..r8) anzeigen\n"
+    "  :f        - Funktionen auflisten (Name, Parameter, RPN)\n"
+    "  :?        - Letzten Postfix-Ausdruck anzeigen\n"
+    "  := <INFIX>- Infix-Ausdruck auswerten (an rpn.js weiterreichen)\n"
+    "  :step     - Step-Modus umschalten (wirkt als --step für rpn.js)\n"
+    "  :p        - Precompile-Modus umschalten (wirkt als --precompile für rpn.js)\n"
+    "  :color    - Farbmodus umschalten (No-Color an/aus -> --nocolor)\n"
+    "  :mark     - Marker-Stil umschalten (--mark)\n"
+    "  :end      - Endstep-Modus umschalten (impliziert Step)\n"
+    "  :infix    - Infix-Ausgabe im Step-Modus umschalten (--infix)\n"
+    "  :si       - Toggle: wenn Step AUS -> Step+Infix EIN; sonst Step AUS\n"
+    "  :sp       - Toggle: wenn Step AUS -> Step+Precompile EIN; sonst Step AUS\n"
+    "  :spi      - Toggle: wenn Step AUS -> Step+Precompile+Infix EIN; sonst Step AUS\n"
+    "  :sip      - Alias zu :spi\n"
+    "  :i        - Eingabe-Modus (tokenweise) umschalten\n"
+    "  :ip       - Im Eingabe-Modus den bisher aufgebauten Postfix über jeder Eingabe anzeigen umschalten\n"
+    "  :q        - Beenden\n"
+    "\n"
+    "Beliebige Eingabe ohne ':' wird als RPN an rpn.js weitergereicht (mit --noprompt und akt. Flags).\n"
+)
 
 def print_help():
     clear_screen()
-    print("RPN-REPL Befehle:")
-    print("  :e        - ~/.simvars.json mit $EDITOR bearbeiten")
-    print("  :fe       - ~/.rpnfunc.json mit $EDITOR bearbeiten")
-    print("  :s        - SimVars anzeigen (aus Datei)")
-    print("  :l        - Persistente Variablen anzeigen (ruft rpn.js --print)")
-    print("  :r        - Persistente Variablen resetten (ruft rpn.js --reset)")
-    print("  :rl       - Result-Stacks (r1..r8) anzeigen")
-    print("  :f        - Funktionen auflisten (Name, Parameter, RPN)")
-    print("  :?        - Letzten Postfix-Ausdruck anzeigen")
-    print("  := <INFIX>- Infix-Ausdruck auswerten (an rpn.js weiterreichen)")
-    print("  :step     - Step-Modus umschalten (wirkt als --step für rpn.js)")
-    print("  :p        - Precompile-Modus umschalten (wirkt als --precompile für rpn.js)")
-    print("  :color    - Farbmodus umschalten (No-Color an/aus -> --nocolor)")
-    print("  :mark     - Marker-Stil umschalten (--mark)")
-    print("  :end      - Endstep-Modus umschalten (impliziert Step)")
-    print("  :infix    - Infix-Ausgabe im Step-Modus umschalten (--infix)")
-    print("  :si       - Toggle: wenn Step AUS -> Step+Infix EIN; sonst Step AUS")
-    print("  :sp       - Toggle: wenn Step AUS -> Step+Precompile EIN; sonst Step AUS")
-    print("  :spi      - Toggle: wenn Step AUS -> Step+Precompile+Infix EIN; sonst Step AUS")
-    print("  :sip      - Alias zu :spi")
-    print("  :i        - Eingabe-Modus (tokenweise) umschalten")
-    print("  :ip       - Im Eingabe-Modus den bisher aufgebauten Postfix über jeder Eingabe anzeigen umschalten")
-    print("  :q        - Beenden")
-    print("")
-    print("Beliebige Eingabe ohne ':' wird als RPN an rpn.js weitergereicht (mit --noprompt und akt. Flags).")
+    sys.stdout.write(_HELP)
+    sys.stdout.flush()
 
 # ----- completion -----
 COMMANDS = [
-    ":e", ":fe", ":s", ":l", ":r", ":rl", ":f", ":?",
+    ":e", ":fe", ":s", ":sj", ":l", ":r", ":rl", ":f", ":?",
     ":step", ":p", ":color", ":mark", ":end", ":infix",
     ":si", ":sp", ":spi", ":sip", ":i", ":ip", ":q", ":="
 ]
@@ -172,9 +238,9 @@ def _gen_registers():
     return t
 REGISTERS = _gen_registers()
 
-def _simvar_suggestions():
+def _simvar_suggestions(data):
     """Create suggestions like (A:   (>A:   (L:  (>L:  and with known keys: (A:KEY) (>A:KEY)"""
-    sim = read_json(SIM_PATH, {"simvars": {}}).get("simvars", {})
+    sim = data.get("simvars", {})
     out = set()
     # base prefixes
     prefixes = set(k for k,v in sim.items() if isinstance(v, dict))
@@ -192,45 +258,70 @@ def _simvar_suggestions():
         if not isinstance(v, dict):
             out.add(f"(A:{k})")
             out.add(f"(>A:{k})")
-    return sorted(out)
-
-def _func_suggestions():
-    arr = read_json(FUNC_PATH, [])
-    names = [f.get("name") for f in arr if isinstance(f, dict) and f.get("name")]
-    return sorted(set([str(n) for n in names if n]))
+    return out
+
+def _func_suggestions(arr):
+    return {str(f["name"]) for f in arr if isinstance(f, dict) and f.get("name")}
+
+# sorted TAB pool for RPN tokens; read_json hands back the same objects while the files
+# are unchanged, so the pool is only rebuilt after an edit (defaults are fixed objects for the same reason)
+_NO_SIMVARS = {"simvars": {}}
+_NO_FUNCS = []
+_SORTED_COMMANDS = sorted(set(COMMANDS))
+_STATIC_POOL = frozenset(OPERATORS) | frozenset(REGISTERS)   # file-independent part, unioned once
+_pool_cache = {"src": None, "pool": []}
+_matches = []   # candidates of the current completion, computed at state 0
+
+def _prefix_range(words, prefix):
+    # words is sorted: all matches form one contiguous slice
+    lo = bisect.bisect_left(words, prefix)
+    hi = lo
+    while hi < len(words) and words[hi].startswith(prefix):
+        hi += 1
+    return words[lo:hi]
+
+def _completion_pool():
+    sim = read_json(SIM_PATH, _NO_SIMVARS)
+    funcs = read_json(FUNC_PATH, _NO_FUNCS)
+    src = _pool_cache["src"]
+    if src is None or src[0] is not sim or src[1] is not funcs:
+        pool = _STATIC_POOL | _func_suggestions(funcs) | _simvar_suggestions(sim)
+        _pool_cache["src"] = (sim, funcs)
+        _pool_cache["pool"] = sorted(pool)
+    return _pool_cache["pool"]
 
 def _complete(text, state):
     """Global completer: suggests depending on leading ':' and token content."""
+    global _matches
+    if state > 0:
+        return _matches[state] if state < len(_matches) else None
+
     buffer = _rl.get_line_buffer() if _rl else ""
     begidx = _rl.get_begidx() if hasattr(_rl, "get_begidx") else 0
     endidx = _rl.get_endidx() if hasattr(_rl, "get_endidx") else 0
 
     # decide namespace
-    candidates = []
     if buffer.strip().startswith(":"):
         # commands + := don't split tokens
-        candidates = [c for c in COMMANDS if c.startswith(buffer.strip())]
+        _matches = _prefix_range(_SORTED_COMMANDS, buffer.strip())
     else:
-        # RPN tokens: merge all sources
-        pool = set()
-        pool.update(OPERATORS)
-        pool.update(REGISTERS)
-        pool.update(_func_suggestions())
-        pool.update(_simvar_suggestions())
+        # RPN tokens: operators, registers, functions, simvars
         # split on whitespace and take last token
         last = buffer[begidx:endidx] if begidx < endidx else (buffer.split()[-1] if buffer.split() else "")
         prefix = last if last else text
-        candidates = [c for c in pool if c.startswith(prefix)]
-
-    candidates = sorted(set(candidates))
-    if state < len(candidates):
-        return candidates[state]
-    return None
+        _matches = _prefix_range(_completion_pool(), prefix)
+    return _matches[0] if _matches else None
 
 def _setup_readline():
+    global _manual_history, _last_added
     if not _rl:
         return
     try:
+        if hasattr(_rl, "set_auto_history"):
+            _rl.set_auto_history(False)
+            _manual_history = True
+            n = _rl.get_current_history_length()
+            _last_added = _rl.get_history_item(n) if n else None
         # Make ':' and parentheses part of words so completion works with (A: etc.
         if hasattr(_rl, "set_completer_delims"):
             delims = _rl.get_completer_delims()
@@ -244,8 +335,56 @@ def _setup_readline():
         pass
 
 # ----- Node integration -----
+# one persistent "node rpn.js --server" process instead of one node start per line
+_server = None
+SERVER_EOT = "\x04"   # marks the status line after each request
+
+def _get_server():
+    global _server
+    if _server is None or _server.poll() is not None:
+        _server = subprocess.Popen(
+            [NODE_BIN, RPN_JS, "--server"],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+            text=True, encoding="utf-8", bufsize=1,
+            close_fds=False,  # Python fds are non-inheritable anyway; skips the fd sweep
+        )
+    return _server
+
+def _stop_server():
+    global _server
+    if _server is None:
+        return
+    try:
+        _server.stdin.close()
+        _server.wait(timeout=2)
+    except Exception:
+        _server.kill()
+    _server = None
+
+def _dump_request(req):
+    # requests hold only strings (argv, typed pN values), so orjson's non-finite float caveat does not apply
+    if orjson is not None:
+        return orjson.dumps(req).decode("utf-8")
+    return json.dumps(req)
+
+def _server_request(args, params):
+    """Send one request, relay its output, return the status dict (None if the server died)."""
+    srv = _get_server()
+    srv.stdin.write(_dump_request({"argv": args, "params": params}) + "\n")
+    srv.stdin.flush()
+    for line in srv.stdout:
+        if line.startswith(SERVER_EOT):
+            return _parse_json(line[1:])
+        sys.stdout.write(line)
+    sys.stdout.flush()
+    return None
+
 def call_node_rpn(expr=None, admin_flag=None, extra_args=None):
-    args = [RPN_JS]
+    if expr is not None:
+        expr = expr.strip()
+        if not expr and not admin_flag:
+            return 0   # nothing to evaluate, no round-trip to rpn.js
+    args = []
     if expr:
         args.append(expr)
     if admin_flag:
@@ -270,25 +409,109 @@ def call_node_rpn(expr=None, admin_flag=None, extra_args=None):
     if extra_args:
         args += extra_args
 
-    cmd = ["node"] + args
+    params = {}
     try:
-        proc = subprocess.run(cmd, text=True)
-        return proc.returncode
+        while True:
+            status = _server_request(args, params)
+            if status is None:
+                print("Fehler: rpn.js --server wurde unerwartet beendet.")
+                return 1
+            if not status.get("need"):
+                return status.get("code", 0)
+            # missing pN: read values like "rpn.js --noprompt" would (no labels)
+            for key in status["need"]:
+                params[key] = input("")
     except FileNotFoundError:
         print("Fehler: Node.js nicht gefunden oder rpn.js Pfad falsch. Setze $RPN_JS oder installiere Node.")
         return 1
+    except (BrokenPipeError, EOFError, KeyboardInterrupt):
+        _stop_server()
+        print("")
+        return 1
 
 def edit_file(path):
     try:
-        subprocess.run([EDITOR, path])
+        subprocess.run([*EDITOR_CMD, path])
     except FileNotFoundError:
         print(f"Editor '{EDITOR}' nicht gefunden. Setze $EDITOR oder installiere {EDITOR}.")
 
+# ----- REPL commands -----
+def _toggle(name, label):
+    def handler():
+        g = globals()
+        g[name] = not g[name]
+        print(f"{label}: {'AN' if g[name] else 'AUS'}")
+    return handler
+
+def _step_with(*names):
+    # :si/:sp/:spi - switch step on together with the given modes, or step off
+    labels = {"infix_mode": "Infix", "precompile_mode": "Precompile"}
+    on_msg = ", ".join(["Step: AN"] + [f"{labels[n]}: AN" for n in names])
+    def handler():
+        global step_mode
+        if not step_mode:
+            step_mode = True
+            for n in names:
+                globals()[n] = True
+            print(on_msg)
+        else:
+            step_mode = False
+            print("Step: AUS")
+    return handler
+
+def _cmd_last_postfix():
+    if last_postfix:
+        print(last_postfix)
+    else:
+        print("(kein letzter Postfix gespeichert)")
+
+def _cmd_endstep():
+    global endstep_mode, step_mode
+    endstep_mode = not endstep_mode
+    if endstep_mode and not step_mode:
+        step_mode = True
+    print(f"Endstep: {'AN' if endstep_mode else 'AUS'}  | Step: {'AN' if step_mode else 'AUS'}")
+
+def _cmd_input_mode():
+    global input_mode, input_buffer
+    input_mode = not input_mode
+    input_buffer = []
+    print(f"Eingabe-Modus (tokenweise): {'AN' if input_mode else 'AUS'}")
+
+# ":cmd" -> handler; one dict lookup per command (":q" and ":= <INFIX>" are handled in repl())
+COMMAND_HANDLERS = {
+    ":e": lambda: edit_file(SIM_PATH),
+    ":fe": lambda: edit_file(FUNC_PATH),
+    ":s": list_simvars,
+    ":sj": list_simvars_pretty,
+    ":l": lambda: call_node_rpn(admin_flag="--print"),
+    ":r": lambda: call_node_rpn(admin_flag="--reset"),
+    ":rl": list_results,
+    ":f": list_functions,
+    ":?": _cmd_last_postfix,
+    ":step": _toggle("step_mode", "Step-Modus"),
+    ":p": _toggle("precompile_mode", "Precompile"),
+    ":color": _toggle("no_color", "No-Color"),
+    ":mark": _toggle("marker", "Marker"),
+    ":end": _cmd_endstep,
+    ":infix": _toggle("infix_mode", "Infix"),
+    ":si": _step_with("infix_mode"),
+    ":sp": _step_with("precompile_mode"),
+    ":spi": _step_with("precompile_mode", "infix_mode"),
+    ":sip": _step_with("precompile_mode", "infix_mode"),
+    ":i": _cmd_input_mode,
+    ":ip": _toggle("input_prompt", "Input-Prompt-Anzeige"),
+}
+
 # ----- REPL -----
 def repl():
-    global step_mode, precompile_mode, no_color, marker, endstep_mode, infix_mode
-    global input_mode, input_prompt, input_buffer, last_postfix
+    global input_buffer, last_postfix
 
+    # start node now: its startup overlaps the help print and the user's first typing
+    try:
+        _get_server()
+    except OSError:
+        pass  # reported by call_node_rpn on first use
     print_help()
     while True:
         try:
@@ -301,6 +524,7 @@ def repl():
         except (EOFError, KeyboardInterrupt):
             print("")
             break
+        _remember(line)
 
         if input_mode:
             if line.strip() == "":
@@ -331,88 +555,17 @@ def repl():
 
         if line.startswith(":"):
             cmd = line.strip()
-            if cmd == ":q":
+            if cmd in (":q", ":quit", ":exit"):
                 break
-            elif cmd == ":e":
-                edit_file(SIM_PATH)
-            elif cmd == ":fe":
-                edit_file(FUNC_PATH)
-            elif cmd == ":s":
-                list_simvars()
-            elif cmd == ":l":
-                call_node_rpn(admin_flag="--print")
-            elif cmd == ":r":
-                call_node_rpn(admin_flag="--reset")
-            elif cmd == ":rl":
-                list_results()
-            elif cmd == ":f":
-                list_functions()
-            elif cmd == ":?":
-                if last_postfix:
-                    print(last_postfix)
-                else:
-                    print("(kein letzter Postfix gespeichert)")
-            elif cmd.startswith(":="):
+            if cmd.startswith(":="):
                 expr = cmd[2:].strip()
                 if not expr:
                     print("Verwendung: := <INFIX-AUSDRUCK>")
                 else:
                     last_postfix = expr
                     call_node_rpn(expr)
-            elif cmd == ":step":
-                step_mode = not step_mode
-                print(f"Step-Modus: {'AN' if step_mode else 'AUS'}")
-            elif cmd == ":p":
-                precompile_mode = not precompile_mode
-                print(f"Precompile: {'AN' if precompile_mode else 'AUS'}")
-            elif cmd == ":color":
-                no_color = not no_color
-                print(f"No-Color: {'AN' if no_color else 'AUS'}")
-            elif cmd == ":mark":
-                marker = not marker
-                print(f"Marker: {'AN' if marker else 'AUS'}")
-            elif cmd == ":end":
-                endstep_mode = not endstep_mode
-                if endstep_mode and not step_mode:
-                    step_mode = True
-                print(f"Endstep: {'AN' if endstep_mode else 'AUS'}  | Step: {'AN' if step_mode else 'AUS'}")
-            elif cmd == ":infix":
-                infix_mode = not infix_mode
-                print(f"Infix: {'AN' if infix_mode else 'AUS'}")
-            elif cmd == ":si":
-                if not step_mode:
-                    step_mode = True
-                    infix_mode = True
-                    print("Step: AN, Infix: AN")
-                else:
-                    step_mode = False
-                    print("Step: AUS")
-            elif cmd == ":sp":
-                if not step_mode:
-                    step_mode = True
-                    precompile_mode = True
-                    print("Step: AN, Precompile: AN")
-                else:
-                    step_mode = False
-                    print("Step: AUS")
-            elif cmd in (":spi", ":sip"):
-                if not step_mode:
-                    step_mode = True
-                    precompile_mode = True
-                    infix_mode = True
-                    print("Step: AN, Precompile: AN, Infix: AN")
-                else:
-                    step_mode = False
-                    print("Step: AUS")
-            elif cmd == ":i":
-                input_mode = not input_mode
-                input_buffer = []
-                print(f"Eingabe-Modus (tokenweise): {'AN' if input_mode else 'AUS'}")
-            elif cmd == ":ip":
-                input_prompt = not input_prompt
-                print(f"Input-Prompt-Anzeige: {'AN' if input_prompt else 'AUS'}")
             else:
-                print_help()
+                COMMAND_HANDLERS.get(cmd, print_help)()
             continue
 
         last_postfix = line.strip()
@@ -426,4 +579,5 @@ if __name__ == "__main__":
     except Exception as e:
         print(f"Fehler im REPL: {e}")
     finally:
+        _stop_server()
         _save_history_truncated()